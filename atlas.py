@@ -0,0 +1,108 @@
+""" All the images of the game packed into a single atlas image, cached next to the assets.
+    The atlas is built once from the separate images in assets/, scaled to the size they are drawn at, and saved
+    with the rectangle of every image in it. Later starts load that one image, unless any of the assets changed since,
+    in which case it is built again. """
+import json
+import os
+
+import pygame
+
+ASSETS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+ATLAS_FILE = os.path.join(ASSETS_DIRECTORY, '.atlas.png')
+LAYOUT_FILE = os.path.join(ASSETS_DIRECTORY, '.atlas.json')
+# Size the tiles of the field are scaled to.
+TILE_SIZE = (25, 25)
+# Images are put in rows of the atlas no wider than this.
+ATLAS_WIDTH = 512
+
+# The images of the atlas, name: (file relative to the assets directory, size to scale to or None to keep it).
+IMAGES = {
+    'initial': ('initial.PNG', TILE_SIZE),
+    'empty': ('empty.PNG', TILE_SIZE),
+    'marked': ('marked.PNG', TILE_SIZE),
+    'uncertain': ('uncertain.PNG', TILE_SIZE),
+    'mine': ('mine1.PNG', TILE_SIZE),
+    'selected_mine': ('mine2.PNG', TILE_SIZE),
+    'wrong_marked': ('mine3.PNG', TILE_SIZE),
+    **{f'neighbours_{count}': (f'{count}.PNG', TILE_SIZE) for count in range(1, 9)},
+    'minus': ('header/-.PNG', None),
+    **{f'digit_{digit}': (f'header/{digit}.PNG', None) for digit in range(10)},
+    'progress_smiley': ('header/progress.PNG', None),
+    'winner_smiley': ('header/winner.PNG', None),
+    'game_over_smiley': ('header/game_over.PNG', None),
+}
+
+
+def signature(images=IMAGES):
+    # Identifies the assets the atlas is built from, by the modification time and size of their files.
+    entries = []
+    for name, (file_name, size) in sorted(images.items()):
+        stat = os.stat(os.path.join(ASSETS_DIRECTORY, file_name))
+        entries.append([name, file_name, size and list(size), stat.st_mtime_ns, stat.st_size])
+    return entries
+
+
+def build_atlas(images=IMAGES):
+    # Loads and scales every image and packs them into rows of the atlas.
+    # Returns the atlas surface and the dict from name to rectangle (x, y, width, height) in it.
+    surfaces, rects = {}, {}
+    x = y = row_height = width = 0
+    for name, (file_name, size) in images.items():
+        surface = pygame.image.load(os.path.join(ASSETS_DIRECTORY, file_name))
+        if size is not None:
+            surface = pygame.transform.scale(surface, size)
+        image_width, image_height = surface.get_size()
+        if x and x + image_width > ATLAS_WIDTH:
+            x, y, row_height = 0, y + row_height, 0
+        surfaces[name] = surface
+        rects[name] = (x, y, image_width, image_height)
+        x += image_width
+        row_height = max(row_height, image_height)
+        width = max(width, x)
+    atlas = pygame.Surface((width, y + row_height))
+    for name, surface in surfaces.items():
+        atlas.blit(surface, rects[name][:2])
+    return atlas, rects
+
+
+def load_atlas(images=IMAGES):
+    """ Returns the Atlas of the images, loaded from the cache if it is up to date, built and cached otherwise. """
+    current = signature(images)
+    try:
+        with open(LAYOUT_FILE) as file:
+            layout = json.load(file)
+        if layout['signature'] == current:
+            return Atlas(pygame.image.load(ATLAS_FILE), {name: tuple(rect) for name, rect in layout['rects'].items()})
+    except (OSError, ValueError, KeyError, pygame.error):
+        pass
+    image, rects = build_atlas(images)
+    try:
+        pygame.image.save(image, ATLAS_FILE)
+        with open(LAYOUT_FILE, 'w') as file:
+            json.dump({'signature': current, 'rects': rects}, file)
+    except (OSError, pygame.error):
+        # The assets directory may be read only, the atlas is then built on every start.
+        pass
+    return Atlas(image, rects)
+
+
+class Atlas:
+    """ The atlas image, and a subsurface of it for every image. """
+
+    def __init__(self, image, rects):
+        self.rects = rects
+        self.set_image(image)
+
+    def set_image(self, image):
+        self.image = image
+        self.images = {name: image.subsurface(rect) for name, rect in self.rects.items()}
+
+    def convert(self):
+        # Converts the atlas to the pixel format of the display, for faster blits, once the display mode is set.
+        self.set_image(self.image.convert())
+
+    def size(self, name):
+        return self.rects[name][2:]
+
+    def __getitem__(self, name):
+        return self.images[name]
@@ -0,0 +1,262 @@
+""" A solver running on a background thread, so that asking it for a move never holds up the frames of the game.
+    The solver plays on a shadow copy of the board, which the game feeds with the squares changed by every operation.
+    Whenever the shadow changes, the worker computes the moves which follow from it into a queue, marking the squares
+    on the shadow as it goes, until the solver is stuck, has to guess, or needs the outcome of an uncover to continue.
+    The game takes moves from the queue without waiting. Every queued move is a deduction which stays valid as the
+    game goes on, except when the player intervenes: cancel drops the queue and takes back the marks played on the
+    shadow ahead of the game, and any reset or game over starts over from the whole board. A generation counter
+    discards the moves computed before the cancel. The shadow of a chunked field only keeps the squares played. """
+from collections import deque
+from threading import Condition, Thread
+
+from minesweeper import MineSweeper, _Field, INIT, PROGRESS, MARK
+from minesweeper import MINE_FLAG, UNCOVERED_FLAG, MARKED_FLAG
+from utilities import solver
+
+# Hides the mine flag of covered squares, the solver is only shown what the player sees.
+_VISIBLE_TABLE = bytes(flags if flags & UNCOVERED_FLAG else flags & ~MINE_FLAG for flags in range(256))
+
+
+class _SparseBuffer:
+    # Looks like the flat buffer of the field, with a byte per square at index x * height + y,
+    # but only keeps the squares which are not zero.
+    __slots__ = ('squares', 'size')
+
+    def __init__(self, size):
+        self.squares = {}
+        self.size = size
+
+    def __getitem__(self, index):
+        return self.squares.get(index, 0)
+
+    def __setitem__(self, index, value):
+        if value:
+            self.squares[index] = value
+        else:
+            self.squares.pop(index, None)
+
+    def __iter__(self):
+        return map(self.__getitem__, range(self.size))
+
+    def __len__(self):
+        return self.size
+
+
+class _SparseField(_Field):
+    # A field keeping only the squares played, as the player sees them, so that its size doesn't matter.
+
+    def reset(self):
+        self.flags = _SparseBuffer(self.width * self.height)
+        self.counts = _SparseBuffer(self.width * self.height)
+        self.marked = 0
+        self.uncertain = 0
+
+    def played(self):
+        # The player sees no flag on the squares which were not played.
+        return sorted(self.flags.squares)
+
+    def covered(self):
+        squares = self.flags.squares
+        return (index for index in range(len(self.flags))
+                if not squares.get(index, 0) & (UNCOVERED_FLAG | MARKED_FLAG))
+
+
+class _Shadow(MineSweeper):
+    # A copy of the board of another minesweeper as its player sees it, kept up to date with the changes fed to it.
+
+    def follow(self, game_state, uncovered, field_mines, indices, flags, counts, reset=False):
+        # Takes the state of the game, and the flags and neighbouring mines of the squares at the given indices,
+        # of all squares when indices is None. With reset, the squares not given are cleared.
+        # Then notifies the listeners of the squares which changed, of the whole field when it was replaced.
+        self.__update_state__(game_state)
+        self.uncovered = uncovered
+        self.field_mines = field_mines
+        field = self.field
+        if indices is None:
+            field.load(flags, counts)
+            self.__notify__(None)
+            return
+        if reset:
+            field.reset()
+        for index, new, count in zip(indices, flags, counts):
+            old = field.flags[index]
+            field.update(index, set_flags=new & ~old, clear_flags=old & ~new)
+            field.counts[index] = count
+        self.__notify__(None if reset else [field.position(index) for index in indices])
+
+
+class _SparseShadow(_Shadow):
+    # A shadow of a field too large to copy, a chunked one.
+
+    def __new_field__(self):
+        return _SparseField(self.field_width, self.field_height)
+
+
+class SolverWorker:
+    """ Computes the moves of the solver for the given minesweeper on a background thread.
+    take returns the next computed move, as (position, MARK or UNCOVER), or None when there is none yet.
+    With sparse, the shadow only keeps the squares played, for chunked fields.
+    Call close once done with the worker. """
+
+    def __init__(self, minesweeper, advanced=False, sparse=False):
+        self.minesweeper = minesweeper
+        self.sparse = sparse
+        shadow = _SparseShadow if sparse else _Shadow
+        self.shadow = shadow(minesweeper.field_width, minesweeper.field_height, minesweeper.field_mines)
+        self.steps = solver(self.shadow, advanced=advanced)
+        # Indices of the squares queued to be uncovered, not uncovered on the shadow yet.
+        self.pending = set()
+        # From the indices of the squares marked on the shadow ahead of the minesweeper, to their flags before.
+        self.ahead = {}
+        # Shared with the thread, under the condition: the changes not applied to the shadow yet,
+        # the computed moves, and whether the thread has nothing to do until the next change.
+        self.condition = Condition()
+        self.changes = []
+        self.moves = deque()
+        self.stalled = False
+        self.generation = 0
+        self.running = True
+        self.__feed(self.__board(), cancel=True)
+        minesweeper.add_listener(self.on_change)
+        self.thread = Thread(target=self.run, name='solver', daemon=True)
+        self.thread.start()
+
+    def on_change(self, positions):
+        # Feeds the squares which changed to the shadow, the whole board when positions is None.
+        if positions is None:
+            self.__feed(self.__board(), cancel=True)
+            return
+        minesweeper = self.minesweeper
+        field = minesweeper.field
+        indices = [field.index(position) for position in positions]
+        self.__feed((minesweeper.game_state, minesweeper.uncovered, minesweeper.field_mines,
+                     indices, *self.__squares(indices), False))
+
+    def __squares(self, indices):
+        # Returns the flags and neighbouring mines the player sees of the squares at the given indices.
+        field = self.minesweeper.field
+        flags = bytes(field.flags[index] for index in indices).translate(_VISIBLE_TABLE)
+        counts = bytes(field.counts[index] if field.flags[index] & UNCOVERED_FLAG else 0 for index in indices)
+        return flags, counts
+
+    def __board(self):
+        # Returns the change replacing the whole board of the shadow with the board of the minesweeper.
+        minesweeper = self.minesweeper
+        field = minesweeper.field
+        state = minesweeper.game_state, minesweeper.uncovered, minesweeper.field_mines
+        if not self.sparse:
+            # Counts of covered squares are never looked at by the solver.
+            return (*state, None, bytes(field.flags).translate(_VISIBLE_TABLE), bytes(field.counts), False)
+        # Only the squares played, none once the game is over since the solver stops there anyway.
+        indices = field.played() if minesweeper.game_state == PROGRESS else []
+        return (*state, indices, *self.__squares(indices), True)
+
+    def cancel(self):
+        """ Drops the computed moves, and starts over from the board as it is now. """
+        # The shadow follows every change of the minesweeper, only the marks played on it ahead have to be taken back,
+        # which the thread does on a None change.
+        self.__feed(None, cancel=True)
+
+    def __feed(self, change, cancel=False):
+        # Queues the change for the thread. With cancel, the moves computed so far are dropped.
+        with self.condition:
+            if cancel:
+                self.generation += 1
+                self.moves.clear()
+            self.changes.append(change)
+            self.stalled = False
+            self.condition.notify()
+
+    def take(self):
+        """ Returns the next move, or None if there is none ready. """
+        flags = self.minesweeper.field.flags
+        with self.condition:
+            while self.moves:
+                position, operation = self.moves.popleft()
+                # The square may have been uncovered along with another since the move was computed.
+                if not flags[self.minesweeper.field.index(position)] & (UNCOVERED_FLAG | MARKED_FLAG):
+                    return position, operation
+        return None
+
+    def busy(self):
+        """ Returns whether the worker may still come up with moves, without any further change to the board. """
+        with self.condition:
+            return bool(self.moves) or not self.stalled
+
+    def run(self):
+        # The loop of the thread: applies the changes to the shadow and queues the moves which follow.
+        while True:
+            with self.condition:
+                while self.running and self.stalled and not self.changes:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                changes, self.changes = self.changes, []
+                generation = self.generation
+            for change in changes:
+                self.__apply(change)
+            moves = self.__solve()
+            with self.condition:
+                if generation == self.generation:
+                    self.moves.extend(moves)
+                    self.stalled = not self.changes
+
+    def __apply(self, change):
+        shadow = self.shadow
+        if change is None:
+            # Cancelled, the squares queued to be uncovered stay covered and the marks ahead are taken back.
+            self.pending.clear()
+            indices, flags = list(self.ahead), bytes(self.ahead.values())
+            self.ahead.clear()
+            if indices:
+                shadow.follow(shadow.game_state, shadow.uncovered, shadow.field_mines,
+                              indices, flags, bytes(len(indices)))
+            return
+        # Squares changed on the minesweeper are not pending nor ahead anymore, whatever changed them.
+        _, _, _, indices, _, _, reset = change
+        if indices is None or reset:
+            self.pending.clear()
+            self.ahead.clear()
+        else:
+            self.pending.difference_update(indices)
+            for index in indices:
+                self.ahead.pop(index, None)
+        shadow.follow(*change)
+
+    def __solve(self):
+        # Returns the moves which follow from the shadow as it is. Marks are played on the shadow right away, uncovers
+        # have to wait for the squares they uncover, so the solver stops at a guess, or once it only comes up with
+        # uncovers already queued, which it does again and again when all its moves are queued.
+        shadow = self.shadow
+        field = shadow.field
+        moves = []
+        repeated = 0
+        while shadow.game_state in (INIT, PROGRESS):
+            try:
+                position, operation = next(self.steps)
+            except StopIteration:
+                break
+            index = field.index(position)
+            if index in self.pending:
+                repeated += 1
+                if repeated > len(self.pending):
+                    break
+                continue
+            repeated = 0
+            moves.append((position, operation))
+            if operation == MARK:
+                self.ahead.setdefault(index, field.flags[index])
+                shadow.toggle(position, force_mark=True)
+            else:
+                self.pending.add(index)
+                if shadow.game_state == INIT or getattr(self.steps, 'guessed', False):
+                    break
+        return moves
+
+    def close(self):
+        self.minesweeper.remove_listener(self.on_change)
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join()
+        self.steps.close()
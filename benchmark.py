@@ -0,0 +1,310 @@
+""" Benchmarks of board generation, uncover flood fill, pending_mines, the solvers and rendering,
+    on seeded boards from beginner up to 1000x1000 with sparse and dense mines.
+    Reports operations per second, latency percentiles and peak memory of each benchmark, and can save the results
+    as a baseline to compare later runs against. Run this module with --help for the options it supports. """
+import json
+import os
+import sys
+import tracemalloc
+from argparse import ArgumentParser
+from time import perf_counter
+
+from minesweeper import MineSweeper
+from utilities import solver, MARK
+from viewport import Viewport
+
+# (name, field width, field height, field mines)
+BOARDS = [
+    ('beginner', 9, 9, 10),
+    ('intermediate', 16, 16, 40),
+    ('expert', 30, 16, 99),
+    ('sparse-200', 200, 200, 2000),
+    ('dense-200', 200, 200, 8000),
+    ('sparse-1000', 1000, 1000, 50000),
+    ('dense-1000', 1000, 1000, 200000),
+]
+# Boards larger than this are not rendered whole, the field surface would take hundreds of megabytes.
+MAX_RENDERED_SQUARES = 100 * 100
+# Size of the viewport when rendering through it, which any board can be.
+VIEWPORT_SIZE = (1200, 750)
+# Calls of the fastest operations are timed in batches of this many.
+BATCH = 1000
+
+
+def _center(minesweeper):
+    return minesweeper.field_width // 2, minesweeper.field_height // 2
+
+
+def bench_generation(minesweeper, rounds):
+    # Placing the mines and counting the neighbouring mines, on the first uncover.
+    latencies = []
+    for round_number in range(rounds):
+        minesweeper.reset(seed=round_number)
+        start = perf_counter()
+        minesweeper.__init_game__(_center(minesweeper))
+        latencies.append(perf_counter() - start)
+    return latencies
+
+
+def bench_reset(minesweeper, rounds):
+    latencies = []
+    for round_number in range(rounds):
+        start = perf_counter()
+        minesweeper.reset(seed=round_number)
+        latencies.append(perf_counter() - start)
+    return latencies
+
+
+def bench_flood_fill(minesweeper, rounds):
+    # The first uncover, which floods the region around the safe first square.
+    latencies = []
+    for round_number in range(rounds):
+        minesweeper.reset(seed=round_number)
+        minesweeper.__init_game__(_center(minesweeper))
+        start = perf_counter()
+        minesweeper.uncover(_center(minesweeper))
+        latencies.append(perf_counter() - start)
+    return latencies
+
+
+def bench_pending_mines(minesweeper, rounds):
+    latencies = []
+    minesweeper.reset(seed=0)
+    minesweeper.uncover(_center(minesweeper))
+    for _ in range(rounds):
+        start = perf_counter()
+        for _ in range(BATCH):
+            minesweeper.pending_mines()
+        latencies.append((perf_counter() - start) / BATCH)
+    return latencies
+
+
+def _bench_solver(minesweeper, rounds, advanced, max_moves=2000):
+    # Time of each move of the solver, over seeded games played until over or max_moves moves.
+    latencies = []
+    steps = solver(minesweeper, advanced=advanced)
+    for round_number in range(rounds):
+        minesweeper.reset(seed=round_number)
+        moves = 0
+        while not minesweeper.game_over() and moves < max_moves:
+            start = perf_counter()
+            try:
+                position, operation = next(steps)
+            except StopIteration:
+                latencies.append(perf_counter() - start)
+                break
+            latencies.append(perf_counter() - start)
+            if operation == MARK:
+                minesweeper.toggle(position, force_mark=True)
+            else:
+                minesweeper.uncover(position)
+            moves += 1
+    steps.close()
+    return latencies
+
+
+def bench_solver(minesweeper, rounds):
+    return _bench_solver(minesweeper, rounds, advanced=False)
+
+
+def bench_advanced_solver(minesweeper, rounds):
+    return _bench_solver(minesweeper, rounds, advanced=True)
+
+
+def _load_main():
+    # Rendering runs without a window through the dummy video driver of SDL.
+    # Returns the main module, or None if pygame is not available.
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    try:
+        import pygame
+    except ImportError:
+        return None
+    import main
+    if not pygame.display.get_init():
+        pygame.init()
+        pygame.display.set_mode((1, 1))
+        main.assets().convert()
+    return main
+
+
+def _draw_minesweeper(main, win, minesweeper, offset):
+    # Draws every square of the field on a new surface and the surface on the window, as the game did on every
+    # frame before the field renderer, the baseline the renderer is measured against.
+    pygame = main.pygame
+    surface = pygame.Surface((minesweeper.field_width * main.tile_width, minesweeper.field_height * main.tile_height))
+    tiles = main.tile_set(main.tile_width)
+    field = minesweeper.field
+    for position in field:
+        index = field.index(position)
+        surface.blit(main.square_tile(tiles, field.flags[index], field.counts[index], minesweeper.game_state),
+                     (position[0] * main.tile_width, position[1] * main.tile_height))
+    win.blit(surface, offset)
+
+
+def bench_render_full(minesweeper, rounds):
+    # Drawing the whole field on every frame, without the field renderer.
+    main = _load_main()
+    minesweeper.reset(seed=0)
+    minesweeper.uncover(_center(minesweeper))
+    win = main.pygame.Surface((minesweeper.field_width * main.tile_width + 10,
+                               minesweeper.field_height * main.tile_height + 10))
+    latencies = []
+    for _ in range(rounds):
+        start = perf_counter()
+        _draw_minesweeper(main, win, minesweeper, (5, 5))
+        latencies.append(perf_counter() - start)
+    return latencies
+
+
+def bench_render_changes(minesweeper, rounds):
+    # Drawing the field after a single square changed, through the persistent field surface.
+    main = _load_main()
+    minesweeper.reset(seed=0)
+    minesweeper.uncover(_center(minesweeper))
+    viewport = Viewport((5, 5), (minesweeper.field_width * main.tile_width,
+                                 minesweeper.field_height * main.tile_height),
+                        (main.tile_width, main.tile_height), minesweeper.field_size)
+    win = main.pygame.Surface((viewport.size[0] + 10, viewport.size[1] + 10))
+    renderer = main.FieldRenderer(minesweeper, viewport)
+    renderer.draw(win)
+    covered = [position for position in minesweeper if not minesweeper[position].uncovered]
+    latencies = []
+    for round_number in range(rounds):
+        minesweeper.toggle(covered[round_number % len(covered)])
+        start = perf_counter()
+        renderer.draw(win)
+        latencies.append(perf_counter() - start)
+    minesweeper.remove_listener(renderer.on_change)
+    return latencies
+
+
+def bench_render_scroll(minesweeper, rounds):
+    # Drawing a window sized viewport while scrolling over the field, at the default and a zoomed out tile size.
+    main = _load_main()
+    minesweeper.reset(seed=0)
+    minesweeper.uncover(_center(minesweeper))
+    viewport = Viewport((5, 5), VIEWPORT_SIZE, (main.tile_width, main.tile_height), minesweeper.field_size)
+    win = main.pygame.Surface((viewport.size[0] + 10, viewport.size[1] + 10))
+    renderer = main.FieldRenderer(minesweeper, viewport)
+    latencies = []
+    for round_number in range(rounds):
+        if round_number == rounds // 2:
+            main.zoom(viewport, -4)
+        viewport.scroll_by(7, 3)
+        start = perf_counter()
+        renderer.draw(win)
+        latencies.append(perf_counter() - start)
+    minesweeper.remove_listener(renderer.on_change)
+    return latencies
+
+
+BENCHMARKS = [
+    ('reset', bench_reset),
+    ('generation', bench_generation),
+    ('flood_fill', bench_flood_fill),
+    ('pending_mines', bench_pending_mines),
+    ('solver', bench_solver),
+    ('advanced_solver', bench_advanced_solver),
+    ('render_full', bench_render_full),
+    ('render_changes', bench_render_changes),
+    ('render_scroll', bench_render_scroll),
+]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def measure(function, board, rounds):
+    """ Runs the benchmark function on a seeded board of the given configuration.
+    Returns a dict of the results, latencies in seconds and peak memory in bytes. """
+    _, width, height, mines = board
+    minesweeper = MineSweeper(width, height, mines, seed=0)
+    latencies = function(minesweeper, rounds)
+    # Peak memory is measured on a separate short run, tracing memory slows everything down.
+    tracemalloc.start()
+    function(MineSweeper(width, height, mines, seed=0), 1)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'calls': len(latencies),
+        'ops_per_sec': len(latencies) / sum(latencies) if sum(latencies) else 0.0,
+        'p50': percentile(latencies, 0.5),
+        'p90': percentile(latencies, 0.9),
+        'p99': percentile(latencies, 0.99),
+        'max': max(latencies),
+        'peak_memory': peak_memory,
+    }
+
+
+def run(boards=BOARDS, benchmarks=BENCHMARKS, rounds=None, report=print):
+    """ Runs the benchmarks on the boards, returns a dict from 'benchmark/board' to the results of measure. """
+    render = _load_main() is not None
+    results = {}
+    for board in boards:
+        name, width, height, _ = board
+        # Fewer rounds on larger boards, so every benchmark takes about the same time.
+        board_rounds = rounds or max(3, min(200, 200000 // (width * height)))
+        for benchmark, function in benchmarks:
+            if benchmark.startswith('render') and not render:
+                continue
+            if benchmark in ('render_full', 'render_changes') and width * height > MAX_RENDERED_SQUARES:
+                continue
+            key = f'{benchmark}/{name}'
+            results[key] = measure(function, board, board_rounds)
+            report(format_result(key, results[key]))
+    return results
+
+
+def format_result(key, result):
+    return f'{key:32} {result["ops_per_sec"]:12.1f} ops/s  p50 {result["p50"] * 1e6:11.1f}us  ' \
+           f'p90 {result["p90"] * 1e6:11.1f}us  p99 {result["p99"] * 1e6:11.1f}us  ' \
+           f'peak {result["peak_memory"] / 2 ** 20:8.2f}MiB'
+
+
+def compare(results, baseline, threshold):
+    """ Returns the list of (key, baseline p50, current p50) for benchmarks whose median latency
+    grew more than threshold (a fraction) over the baseline. """
+    regressions = []
+    for key, result in results.items():
+        if key in baseline and result['p50'] > baseline[key]['p50'] * (1 + threshold):
+            regressions.append((key, baseline[key]['p50'], result['p50']))
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(description='Benchmarks of the minesweeper, solvers and rendering.')
+    parser.add_argument('--boards', nargs='*', default=None, help='names of the boards to run, all by default: '
+                        + ', '.join(board[0] for board in BOARDS))
+    parser.add_argument('--benchmarks', nargs='*', default=None, help='names of the benchmarks to run, '
+                        'all by default: ' + ', '.join(benchmark[0] for benchmark in BENCHMARKS))
+    parser.add_argument('--rounds', type=int, default=None, help='rounds of each benchmark, scaled by board size '
+                        'by default.')
+    parser.add_argument('--save', help='save the results as a baseline to the given json file.')
+    parser.add_argument('--compare', help='compare the results with the baseline in the given json file.')
+    parser.add_argument('--threshold', type=float, default=0.1, help='the fraction by which the median latency '
+                        'may grow over the baseline before it counts as a regression.')
+    args = parser.parse_args()
+
+    boards = [board for board in BOARDS if args.boards is None or board[0] in args.boards]
+    benchmarks = [benchmark for benchmark in BENCHMARKS if args.benchmarks is None or benchmark[0] in args.benchmarks]
+    results = run(boards, benchmarks, rounds=args.rounds)
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        for key, before, after in regressions:
+            print(f'REGRESSION {key}: p50 {before * 1e6:.1f}us -> {after * 1e6:.1f}us ({after / before - 1:+.0%})')
+        if regressions:
+            sys.exit(1)
+        print('No regressions.')
+
+
+if __name__ == '__main__':
+    main()
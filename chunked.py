@@ -0,0 +1,238 @@
+""" A minesweeper for very large fields, whose mines are generated a chunk at a time on demand.
+    The field is split in square chunks. Once the first square is uncovered, the mines of every chunk only depend on
+    the seed of the game and the coordinates of the chunk, so a chunk is generated the first time one of its squares
+    is looked at, and an untouched chunk can be dropped and generated again at any time.
+    Nothing is allocated per square of the whole field, time and memory grow with the area actually played. """
+import zlib
+from collections import OrderedDict
+from itertools import compress, islice
+from random import Random
+
+from minesweeper import MineSweeper, _Field, _Neighbours, _PLAYED_TABLE, MINE_FLAG, UNCOVERED_FLAG
+
+# Maps the flags of a square to 1 if it is neither a mine nor uncovered, a chunk without these is resolved.
+_COVERED_SAFE_TABLE = bytes(0 if flags & (MINE_FLAG | UNCOVERED_FLAG) else 1 for flags in range(256))
+# Number of the least recently used chunks looked at for eviction, each time a chunk is materialised.
+_EVICTION_CANDIDATES = 8
+
+
+class _ChunkedBuffer:
+    # Looks like the flat buffer of the field, with a byte per square at index x * height + y,
+    # but reads and writes the buffer of the chunk holding the square.
+    # slot is 0 for the flags and 1 for the neighbouring mines.
+    __slots__ = ('_field', '_slot')
+
+    def __init__(self, field, slot):
+        self._field = field
+        self._slot = slot
+
+    def __getitem__(self, index):
+        chunk, local = self._field.locate(index)
+        # Before the mines are placed, all squares are blank.
+        return chunk[self._slot][local] if chunk is not None else 0
+
+    def __setitem__(self, index, value):
+        chunk, local = self._field.locate(index)
+        if chunk is None:
+            raise ValueError('the squares can only be changed once the mines are placed')
+        chunk[self._slot][local] = value
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self)))
+
+    def __len__(self):
+        return self._field.width * self._field.height
+
+
+class _ChunkedField(_Field):
+    """ The field of a ChunkedMineSweeper.
+        The square at (x, y) still has index x * height + y, and flags, counts and neighbours are indexed the same way
+        as the buffers of _Field, but every chunk keeps its own buffers with the square at (x, y) of the chunk at
+        x * chunk height + y. Materialised chunks are kept in least recently used order, when there are more than
+        max_chunks of them the oldest ones without any change are dropped, and the resolved ones (all squares but
+        the mines uncovered) are compressed, the chunks still being played are kept. """
+
+    def __init__(self, width, height, chunk_size, max_chunks):
+        self.width = width
+        self.height = height
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.neighbours = _Neighbours(width, height)
+        self.flags = _ChunkedBuffer(self, 0)
+        self.counts = _ChunkedBuffer(self, 1)
+        self.reset()
+
+    def reset(self):
+        # The seed of the mines of the game, None until the mines are placed.
+        self.seed = None
+        self.mines = 0
+        # Positions on which no mine is placed, the first uncovered square and its neighbours.
+        self.safe = frozenset()
+        # From chunk coordinates to (flags, counts) of the materialised chunks, least recently used first.
+        self.chunks = OrderedDict()
+        # From chunk coordinates to the compressed flags of resolved chunks.
+        self.resolved = {}
+        # From chunk coordinates to the indices within the chunk of its mines, least recently used first.
+        self.chunk_mines_cache = OrderedDict()
+        self.marked = 0
+        self.uncertain = 0
+
+    def place(self, seed, init_position, mines):
+        """ Places the given number of mines, seeded by seed, none of them on init_position or its neighbours.
+        Returns the number of mines actually placed, which is lower only when the chunks around init_position are
+        too small to hold their share of the mines outside of the safe squares. """
+        self.seed = seed
+        self.mines = mines
+        x, y = init_position
+        self.safe = frozenset((nx, ny) for nx in range(x - 1, x + 2) for ny in range(y - 1, y + 2)
+                              if 0 <= nx < self.width and 0 <= ny < self.height)
+        missing = 0
+        for key in {self.chunk_key(position) for position in self.safe}:
+            missing += self.chunk_mine_count(key) - len(self.chunk_mines(key))
+        return mines - missing
+
+    def played(self):
+        # Only the squares of the materialised and resolved chunks may have been played, the others are untouched.
+        indices = []
+        for key in list(self.chunks) + list(self.resolved):
+            chunk = self.chunks.get(key)
+            flags = chunk[0] if chunk is not None else zlib.decompress(self.resolved[key])
+            x, y, _, chunk_height = self.chunk_bounds(key)
+            indices.extend((x + local // chunk_height) * self.height + y + local % chunk_height
+                           for local in compress(range(len(flags)), flags.translate(_PLAYED_TABLE)))
+        return sorted(indices)
+
+    def chunk_key(self, position):
+        return position[0] // self.chunk_size, position[1] // self.chunk_size
+
+    def chunk_bounds(self, key):
+        # Returns (x, y) of the first square of the chunk, and its width and height.
+        x, y = key[0] * self.chunk_size, key[1] * self.chunk_size
+        return x, y, min(self.chunk_size, self.width - x), min(self.chunk_size, self.height - y)
+
+    def chunk_mine_count(self, key):
+        # The mines are shared between the chunks in proportion to their area: taking the chunks column after column,
+        # a chunk gets the mines between the shares of the squares before it and up to its end, rounded down,
+        # so all the shares add up to exactly the number of mines.
+        x, y, chunk_width, chunk_height = self.chunk_bounds(key)
+        squares = self.width * self.height
+        before = x * self.height + y * chunk_width
+        return self.mines * (before + chunk_width * chunk_height) // squares - self.mines * before // squares
+
+    def chunk_mines(self, key):
+        # Returns the indices within the chunk of its mines, only depending on the seed and the chunk.
+        mines = self.chunk_mines_cache.get(key)
+        if mines is not None:
+            self.chunk_mines_cache.move_to_end(key)
+            return mines
+        x, y, chunk_width, chunk_height = self.chunk_bounds(key)
+        random = Random(f'{self.seed}/{key[0]}/{key[1]}')
+        candidates = range(chunk_width * chunk_height)
+        if any(self.chunk_key(position) == key for position in self.safe):
+            candidates = [local for local in candidates
+                          if (x + local // chunk_height, y + local % chunk_height) not in self.safe]
+        mines = tuple(random.sample(candidates, min(len(candidates), self.chunk_mine_count(key))))
+        self.chunk_mines_cache[key] = mines
+        # The chunks materialised and their neighbours are all that is needed.
+        if len(self.chunk_mines_cache) > 9 * self.max_chunks:
+            self.chunk_mines_cache.popitem(last=False)
+        return mines
+
+    def locate(self, index):
+        # Returns the (flags, counts) buffers of the chunk holding the square at the given index, and the index
+        # of the square within the chunk, or (None, 0) while the mines are not placed.
+        if self.seed is None:
+            return None, 0
+        x, y = divmod(index, self.height)
+        if not 0 <= x < self.width:
+            raise IndexError(index)
+        size = self.chunk_size
+        key = x // size, y // size
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.materialise(key)
+        else:
+            self.chunks.move_to_end(key)
+        chunk_height = min(size, self.height - key[1] * size)
+        return chunk, (x - key[0] * size) * chunk_height + y - key[1] * size
+
+    def materialise(self, key):
+        # Builds the buffers of the chunk, from its compressed flags if it was resolved and from its mines otherwise.
+        # The neighbouring mines of the squares on the border of the chunk depend on the mines of the neighbouring
+        # chunks, which are generated as well but not materialised.
+        x, y, chunk_width, chunk_height = self.chunk_bounds(key)
+        compressed = self.resolved.pop(key, None)
+        if compressed is not None:
+            flags = bytearray(zlib.decompress(compressed))
+        else:
+            flags = bytearray(chunk_width * chunk_height)
+            for local in self.chunk_mines(key):
+                flags[local] = MINE_FLAG
+        counts = bytearray(chunk_width * chunk_height)
+        size = self.chunk_size
+        for neighbour_x in range(key[0] - 1, key[0] + 2):
+            for neighbour_y in range(key[1] - 1, key[1] + 2):
+                if not (0 <= neighbour_x * size < self.width and 0 <= neighbour_y * size < self.height):
+                    continue
+                neighbour_height = min(size, self.height - neighbour_y * size)
+                for local in self.chunk_mines((neighbour_x, neighbour_y)):
+                    # The mine relative to this chunk.
+                    mine_x = neighbour_x * size + local // neighbour_height - x
+                    mine_y = neighbour_y * size + local % neighbour_height - y
+                    if -1 <= mine_x <= chunk_width and -1 <= mine_y <= chunk_height:
+                        for nx in range(max(0, mine_x - 1), min(chunk_width, mine_x + 2)):
+                            for ny in range(max(0, mine_y - 1), min(chunk_height, mine_y + 2)):
+                                if nx != mine_x or ny != mine_y:
+                                    counts[nx * chunk_height + ny] += 1
+        chunk = self.chunks[key] = (flags, counts)
+        self.evict()
+        return chunk
+
+    def evict(self):
+        # Evicts the least recently used chunks which can be restored, while there are too many of them.
+        # The most recently used chunk is never evicted, its buffers are being handed out.
+        if len(self.chunks) <= self.max_chunks:
+            return
+        for key in list(islice(self.chunks, min(_EVICTION_CANDIDATES, len(self.chunks) - 1))):
+            flags = self.chunks[key][0]
+            if max(flags) <= MINE_FLAG:
+                # Untouched, it is generated again when needed.
+                del self.chunks[key]
+            elif 1 not in flags.translate(_COVERED_SAFE_TABLE):
+                self.resolved[key] = zlib.compress(bytes(flags))
+                del self.chunks[key]
+            if len(self.chunks) <= self.max_chunks:
+                break
+
+
+class ChunkedMineSweeper(MineSweeper):
+    """ A MineSweeper whose mines are generated a chunk of chunk_size x chunk_size squares at a time,
+    when a square of the chunk or of a neighbouring chunk is first looked at.
+    It plays exactly as MineSweeper, with the first uncovered square and its neighbours free of mines,
+    but the mines are placed differently, so the same seed gives a different game.
+    At most max_chunks chunks are kept materialised, unless more of them are being played.
+    NOTE: mines can't be loaded, they always derive from the seed. """
+
+    def __init__(self, field_width, field_height, field_mines, seed=None, chunk_size=64, max_chunks=256):
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        # The number of mines of every game, field_mines is lower in the rare games the chunks
+        # around the first uncovered square can't hold their share of the mines.
+        self.requested_mines = min(field_width * field_height - 9, max(0, field_mines))
+        super().__init__(field_width, field_height, field_mines, seed=seed)
+
+    def __new_field__(self):
+        return _ChunkedField(self.field_width, self.field_height, self.chunk_size, self.max_chunks)
+
+    def __reset__(self):
+        self.field_mines = self.requested_mines
+        self.total_non_mines = self.field_width * self.field_height - self.field_mines
+        super().__reset__()
+
+    def __place_mines__(self, init_position):
+        # Only the seed of the game is drawn, the chunks derive their mines from it.
+        self.field_mines = self.field.place(self.random.getrandbits(64), init_position, self.requested_mines)
+        self.total_non_mines = self.field_width * self.field_height - self.field_mines
+
+    def load_mines(self, mines, neighbouring_mines=None):
+        raise TypeError('the mines of a chunked field are generated from the seed')
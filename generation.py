@@ -0,0 +1,64 @@
+""" Vectorized generation of many boards at once with numpy, for simulations.
+    Boards are arrays of shape (count, field_width, field_height), indexed [board, x, y] like the field,
+    so a single board is laid out in memory in the order MineSweeper.load_mines expects. """
+import numpy as np
+
+
+def safe_zones(field_width, field_height, init_positions):
+    # Returns a boolean array of shape (count, field_width, field_height), True on each initial position
+    # and its neighbours. init_positions is an array of shape (count, 2) of (x, y).
+    init_positions = np.asarray(init_positions).reshape(-1, 2)
+    xs = np.arange(field_width)[None, :, None]
+    ys = np.arange(field_height)[None, None, :]
+    return (np.abs(xs - init_positions[:, 0, None, None]) <= 1) & \
+        (np.abs(ys - init_positions[:, 1, None, None]) <= 1)
+
+
+def place_mines(count, field_width, field_height, field_mines, init_positions, rng=None):
+    """ Returns a boolean array of shape (count, field_width, field_height) with field_mines mines on each board,
+    none of them on the initial position of the board or its neighbours.
+    init_positions is either a single (x, y) for all boards, or an array of shape (count, 2).
+    Every board is drawn by giving each square a random key and taking the squares with the smallest keys,
+    which is a uniform sample without replacement, done for all the boards at once. """
+    rng = np.random.default_rng(rng)
+    init_positions = np.broadcast_to(np.asarray(init_positions).reshape(-1, 2), (count, 2))
+    safe = safe_zones(field_width, field_height, init_positions).reshape(count, -1)
+    field_mines = min(field_width * field_height - int(safe.sum(axis=1).max()), max(0, field_mines))
+
+    mines = np.zeros((count, field_width * field_height), dtype=bool)
+    if field_mines:
+        keys = rng.random(mines.shape)
+        # Safe squares get keys larger than any random one, so these are never taken.
+        keys[safe] = 2.0
+        chosen = np.argpartition(keys, field_mines - 1, axis=1)[:, :field_mines]
+        np.put_along_axis(mines, chosen, True, axis=1)
+    return mines.reshape(count, field_width, field_height)
+
+
+def count_neighbouring_mines(mines):
+    """ Returns the number of neighbouring mines of every square of every board, as an uint8 array of the same
+    shape, summing the eight shifted copies of the zero padded boards (a 3x3 convolution without the centre). """
+    count, field_width, field_height = mines.shape
+    padded = np.zeros((count, field_width + 2, field_height + 2), dtype=np.uint8)
+    padded[:, 1:-1, 1:-1] = mines
+    neighbouring_mines = np.zeros(mines.shape, dtype=np.uint8)
+    for dx in range(3):
+        for dy in range(3):
+            if dx != 1 or dy != 1:
+                neighbouring_mines += padded[:, dx:dx + field_width, dy:dy + field_height]
+    return neighbouring_mines
+
+
+def generate_boards(count, field_width, field_height, field_mines, init_positions, rng=None):
+    """ Generates count boards at once.
+    Returns (mines, neighbouring_mines), arrays of shape (count, field_width, field_height). """
+    mines = place_mines(count, field_width, field_height, field_mines, init_positions, rng=rng)
+    return mines, count_neighbouring_mines(mines)
+
+
+def hydrate(minesweeper, mines, neighbouring_mines=None):
+    """ Loads a single generated board, arrays of shape (field_width, field_height), into the minesweeper.
+    The buffers are copied as a whole without any work per square. """
+    minesweeper.load_mines(np.ascontiguousarray(mines, dtype=np.uint8),
+                           None if neighbouring_mines is None else np.ascontiguousarray(neighbouring_mines,
+                                                                                         dtype=np.uint8))
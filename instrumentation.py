@@ -0,0 +1,161 @@
+""" Opt-in counters and timing histograms for the hot paths of the game.
+    Nothing is measured until enable is called, which wraps the public operations of MineSweeper and the solvers
+    with timed versions. disable puts the original methods back, so there is no overhead at all when disabled. """
+import csv
+import json
+from functools import wraps
+from math import log2
+from time import perf_counter
+
+from minesweeper import MineSweeper
+from utilities import Solver, AdvancedSolver
+
+# Methods measured once enabled, per class.
+INSTRUMENTED = {
+    MineSweeper: ('uncover', 'toggle', 'uncover_neighbours', 'apply_moves', 'reset', 'load_mines', 'pending_mines',
+                  'time_progressed'),
+    Solver: ('__next__',),
+    AdvancedSolver: ('__next__', 'analyse'),
+}
+# Methods overridden by calling the method of the parent class, of which only the outermost call is recorded,
+# under the name of the class of the object, so that each move of a solver is recorded once.
+OUTERMOST = ('__next__',)
+
+
+class Histogram:
+    """ Histogram of durations, in buckets growing by powers of two from a microsecond. """
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, seconds):
+        bucket = max(0, int(log2(seconds * 1e6))) if seconds > 1e-6 else 0
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction):
+        # Returns the upper bound of the bucket holding the given fraction of the durations, in seconds.
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= fraction * self.count:
+                return min(self.max, 2 ** (bucket + 1) / 1e6)
+        return 0.0
+
+    def summary(self):
+        return {'count': self.count, 'total': self.total, 'mean': self.mean, 'min': self.min, 'max': self.max,
+                'p50': self.percentile(0.5), 'p90': self.percentile(0.9), 'p99': self.percentile(0.99)}
+
+
+class Instrumentation:
+    """ Named counters and timing histograms. """
+
+    def __init__(self):
+        self.enabled = False
+        self.counters = {}
+        self.histograms = {}
+        # The original methods replaced by enable, as (class, name, method).
+        self.originals = []
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record(self, name, seconds):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.add(seconds)
+
+    def timed(self, name, method):
+        # Returns the method wrapped to record its duration under the given name.
+        record = self.record
+
+        @wraps(method)
+        def timed_method(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                record(name, perf_counter() - start)
+
+        return timed_method
+
+    def timed_outermost(self, name, method, running):
+        # Returns the method wrapped to record its duration under the given name, unless it is called from within
+        # another timed call on the same object. running holds the ids of the objects being timed.
+        record = self.record
+
+        @wraps(method)
+        def timed_method(obj, *args, **kwargs):
+            if id(obj) in running:
+                return method(obj, *args, **kwargs)
+            running.add(id(obj))
+            start = perf_counter()
+            try:
+                return method(obj, *args, **kwargs)
+            finally:
+                running.discard(id(obj))
+                record(name, perf_counter() - start)
+
+        return timed_method
+
+    def enable(self, instrumented=INSTRUMENTED):
+        if self.enabled:
+            return
+        self.enabled = True
+        running = {name: set() for name in OUTERMOST}
+        for cls, names in instrumented.items():
+            for name in names:
+                # Only the methods the class defines itself, inherited ones are measured on the parent.
+                if name in vars(cls):
+                    method = vars(cls)[name]
+                    self.originals.append((cls, name, method))
+                    if name in running:
+                        timed = self.timed_outermost(f'{cls.__name__}.{name}', method, running[name])
+                    else:
+                        timed = self.timed(f'{cls.__name__}.{name}', method)
+                    setattr(cls, name, timed)
+
+    def disable(self):
+        for cls, name, method in reversed(self.originals):
+            setattr(cls, name, method)
+        self.originals.clear()
+        self.enabled = False
+
+    def reset(self):
+        self.counters.clear()
+        self.histograms.clear()
+
+    def summary(self):
+        return {'counters': dict(self.counters),
+                'timings': {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}}
+
+    def dump(self, path):
+        """ Writes the counters and timings to the given file, as CSV if it ends with .csv and JSON otherwise. """
+        summary = self.summary()
+        with open(path, 'w', newline='') as file:
+            if path.endswith('.csv'):
+                fields = ['name', 'count', 'total', 'mean', 'min', 'max', 'p50', 'p90', 'p99']
+                writer = csv.DictWriter(file, fieldnames=fields)
+                writer.writeheader()
+                for name, count in summary['counters'].items():
+                    writer.writerow({'name': name, 'count': count})
+                for name, timing in summary['timings'].items():
+                    writer.writerow(dict(timing, name=name))
+            else:
+                json.dump(summary, file, indent=2)
+
+
+# The instrumentation used by the game.
+instrumentation = Instrumentation()
@@ -0,0 +1,140 @@
+""" Load generator for the game server, measuring its throughput and latency.
+    Opens a number of connections, each playing its share of the sessions concurrently: every session asks the server
+    for a hint and plays all the moves it suggests at once, or uncovers a random covered square when there is none,
+    over and over, starting a new game whenever one is over. Run this module with --help for the options it supports. """
+import asyncio
+import json
+from argparse import ArgumentParser
+from random import Random
+from time import perf_counter
+
+from benchmark import percentile
+from server import COVERED_CELL
+
+
+class Client:
+    """ A connection to the server. The sessions sharing it take turns, each request waits for its response. """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.lock = asyncio.Lock()
+        self.next_id = 0
+        # Latency of every request, in seconds.
+        self.latencies = []
+
+    async def request(self, **request):
+        async with self.lock:
+            self.next_id += 1
+            request['id'] = self.next_id
+            start = perf_counter()
+            self.writer.write(json.dumps(request, separators=(',', ':')).encode() + b'\n')
+            response = json.loads(await self.reader.readline())
+            self.latencies.append(perf_counter() - start)
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response
+
+
+class Game:
+    """ The squares of a session as the client sees them. """
+
+    def __init__(self, session, width, height):
+        self.session = session
+        self.width = width
+        self.height = height
+        self.covered = {(x, y) for x in range(width) for y in range(height)}
+        self.over = False
+
+    def update(self, response):
+        for x, y, cell in response['changed']:
+            if cell == COVERED_CELL:
+                self.covered.add((x, y))
+            else:
+                self.covered.discard((x, y))
+        self.over = response['state'] in ('WINNER', 'GAME_OVER')
+
+
+async def play(client, game, random, hint_ratio):
+    # Makes a move on the game: with probability hint_ratio the moves hinted by the solver, played in a single batch,
+    # a random uncover otherwise.
+    if random.random() < hint_ratio:
+        moves = (await client.request(op='hint', session=game.session))['moves']
+        if moves:
+            game.update(await client.request(op='moves', session=game.session, moves=moves))
+            return
+    x, y = random.choice(sorted(game.covered))
+    game.update(await client.request(op='uncover', session=game.session, x=x, y=y))
+
+
+async def session(client, width, height, mines, seed, deadline, hint_ratio):
+    # Plays games on a session until the deadline, returns the number of games completed.
+    random = Random(seed)
+    created = await client.request(op='create', width=width, height=height, mines=mines, seed=seed)
+    game, games = Game(created['session'], width, height), 0
+    while perf_counter() < deadline:
+        await play(client, game, random, hint_ratio)
+        if game.over:
+            games += 1
+            await client.request(op='close', session=game.session)
+            created = await client.request(op='create', width=width, height=height, mines=mines,
+                                           seed=random.getrandbits(32))
+            game = Game(created['session'], width, height)
+    await client.request(op='close', session=game.session)
+    return games
+
+
+async def connection(host, port, sessions, width, height, mines, seed, duration, hint_ratio):
+    # Plays the given number of sessions over a single connection, requests of the sessions interleave.
+    reader, writer = await asyncio.open_connection(host, port, limit=2 ** 20)
+    client = Client(reader, writer)
+    deadline = perf_counter() + duration
+    games = await asyncio.gather(*(session(client, width, height, mines, seed * 1_000_003 + number, deadline,
+                                           hint_ratio) for number in range(sessions)))
+    writer.close()
+    return client.latencies, sum(games)
+
+
+async def run(host, port, connections, sessions, width, height, mines, seed, duration, hint_ratio):
+    start = perf_counter()
+    results = await asyncio.gather(*(connection(host, port, sessions // connections + (number < sessions % connections),
+                                                width, height, mines, seed + number, duration, hint_ratio)
+                                     for number in range(connections)))
+    elapsed = perf_counter() - start
+    latencies = [latency for connection_latencies, _ in results for latency in connection_latencies]
+    return {
+        'requests': len(latencies),
+        'games': sum(games for _, games in results),
+        'requests_per_sec': len(latencies) / elapsed,
+        'p50': percentile(latencies, 0.5),
+        'p90': percentile(latencies, 0.9),
+        'p99': percentile(latencies, 0.99),
+        'max': max(latencies),
+    }
+
+
+def main():
+    parser = ArgumentParser(description='Measures the throughput and latency of the game server.')
+    parser.add_argument('--host', default='127.0.0.1', help='the address of the server.')
+    parser.add_argument('--port', type=int, default=8765, help='the port of the server.')
+    parser.add_argument('--connections', type=int, default=10, help='the number of connections.')
+    parser.add_argument('--sessions', type=int, default=1000, help='the number of concurrent sessions.')
+    parser.add_argument('--field_width', type=int, default=30, help='the number of columns in the field.')
+    parser.add_argument('--field_height', type=int, default=16, help='the number of rows in the field.')
+    parser.add_argument('--field_mines', type=int, default=99, help='the number of mines in the field.')
+    parser.add_argument('--seed', type=int, default=0, help='the seed of the games.')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds to run for.')
+    parser.add_argument('--hint_ratio', type=float, default=0.5,
+                        help='the fraction of the moves asked to the solver of the server, the others are random.')
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.host, args.port, args.connections, max(args.connections, args.sessions),
+                             args.field_width, args.field_height, args.field_mines, args.seed, args.duration,
+                             args.hint_ratio))
+    print(f'{result["requests"]} requests, {result["games"]} games, {result["requests_per_sec"]:.1f} requests/s, '
+          f'p50 {result["p50"] * 1000:.2f}ms p90 {result["p90"] * 1000:.2f}ms p99 {result["p99"] * 1000:.2f}ms '
+          f'max {result["max"] * 1000:.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
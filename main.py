@@ -1,237 +1,600 @@
+import os
 from argparse import ArgumentParser
+from functools import lru_cache
+from time import time, perf_counter
 
 import pygame
 
+from atlas import load_atlas, TILE_SIZE
 from minesweeper import INIT, WINNER, PROGRESS, GAME_OVER
+from minesweeper import MINE_FLAG, UNCOVERED_FLAG, MARKED_FLAG, UNCERTAIN_FLAG
 from minesweeper import MineSweeper
-from utilities import solver, UNCOVER, MARK
+from chunked import ChunkedMineSweeper
+from noguess import NoGuessMineSweeper, BoardGenerator
+from instrumentation import instrumentation
+from recording import MoveLog, save_snapshot, load_snapshot, PLAYER, SOLVER
+from recording import UNCOVER_MOVE, TOGGLE_MOVE, MARK_MOVE, UNCOVER_NEIGHBOURS_MOVE
+from autoplay import SolverWorker
+from utilities import UNCOVER, MARK
+from viewport import Viewport, local_position
 
 MIN_FIELD_MINES = 10
 MIN_FIELD_WIDTH = 10
-MAX_FIELD_WIDTH = 30
 MIN_FIELD_HEIGHT = 8
-MAX_FIELD_HEIGHT = 20
-
-parser = ArgumentParser(description='Yet Another Minesweeper Game.')
-parser.add_argument('--field_width', type=int, default=MIN_FIELD_WIDTH, help="the number of columns in the field.")
-parser.add_argument('--field_height', type=int, default=MIN_FIELD_HEIGHT, help="the number of rows in the field.")
-parser.add_argument('--field_mines', type=int, default=MIN_FIELD_MINES, help='the number of mines in the field.')
-args = parser.parse_args()
-
-# Obtain the arguments from the command line.
-field_width = min(MAX_FIELD_WIDTH, max(args.field_width, MIN_FIELD_WIDTH))
-field_height = min(MAX_FIELD_HEIGHT, max(args.field_height, MIN_FIELD_HEIGHT))
-field_mines = min(field_width * field_height - 9, max(args.field_mines, MIN_FIELD_MINES))
-
-pygame.init()
-
-def load_image(file_name):
-    image = pygame.image.load(file_name)
-    return pygame.transform.scale(image, (25, 25))
-
-# Load all the image assets.
-initial_tile = load_image('assets/initial.PNG')
-empty_tile = load_image('assets/empty.PNG')
-marked_tile = load_image('assets/marked.PNG')
-uncertain_tile = load_image('assets/uncertain.PNG')
-mine_tile = load_image('assets/mine1.PNG')
-selected_mine_tile = load_image('assets/mine2.PNG')
-wrong_marked_tile = load_image('assets/mine3.PNG')
-neighbour_tiles = {
-    1: load_image('assets/1.PNG'),
-    2: load_image('assets/2.PNG'),
-    3: load_image('assets/3.PNG'),
-    4: load_image('assets/4.PNG'),
-    5: load_image('assets/5.PNG'),
-    6: load_image('assets/6.PNG'),
-    7: load_image('assets/7.PNG'),
-    8: load_image('assets/8.PNG'),
-}
-
-minus_image = pygame.image.load('assets/header/-.PNG')
-digit_images = {
-    0: pygame.image.load('assets/header/0.PNG'),
-    1: pygame.image.load('assets/header/1.PNG'),
-    2: pygame.image.load('assets/header/2.PNG'),
-    3: pygame.image.load('assets/header/3.PNG'),
-    4: pygame.image.load('assets/header/4.PNG'),
-    5: pygame.image.load('assets/header/5.PNG'),
-    6: pygame.image.load('assets/header/6.PNG'),
-    7: pygame.image.load('assets/header/7.PNG'),
-    8: pygame.image.load('assets/header/8.PNG'),
-    9: pygame.image.load('assets/header/9.PNG'),
-}
-
-progress_smiley = pygame.image.load('assets/header/progress.PNG')
-winner_smiley = pygame.image.load('assets/header/winner.PNG')
-game_over_smiley = pygame.image.load('assets/header/game_over.PNG')
-
-
-tile_width, tile_height = initial_tile.get_rect().size
-digit_width, digit_height = minus_image.get_rect().size
-
-
-def draw_minesweeper(win, minesweeper, offset=(0, 0)):
-    # Draws the minesweeper field on the given window starting at the given offset.
-    width = field_width * tile_width
-    height = field_height * tile_height
-    surface = pygame.Surface((width, height))
-
-    for position, square in minesweeper.field.items():
-        # Draws the squares based on their flags (marked/ uncertain) and game state.
-        blit_position = (position[0] * tile_width, position[1] * tile_height)
-        if not square.mine and square.uncovered:
-            if square.neighbour_mines:
-                surface.blit(neighbour_tiles[square.neighbouring_mines], blit_position)
-            if not square.neighbour_mines:
-                surface.blit(empty_tile, blit_position)
-
-        if minesweeper.game_over():
-            if square.mine and square.marked:
-                surface.blit(marked_tile, blit_position)
-            elif square.mine and not square.marked:
-                if not square.uncovered:
-                    surface.blit(mine_tile if minesweeper.game_state == GAME_OVER else marked_tile, blit_position)
-                else:
-                    surface.blit(selected_mine_tile, blit_position)
-            elif not square.mine and square.marked:
-                surface.blit(wrong_marked_tile, blit_position)
-            elif not square.uncovered:
-                surface.blit(initial_tile, blit_position)
+# Size of the window when the size of the screen is not known, larger fields are scrolled.
+DEFAULT_MAX_WINDOW_SIZE = (1280, 800)
+# Tile sizes to zoom through, the tiles are drawn at 25 pixels by default.
+ZOOM_LEVELS = (2, 3, 4, 6, 8, 12, 16, 20, 25, 32, 40)
+# Below this tile size, tiles are drawn as flat squares of their average colour.
+DETAILED_TILE_SIZE = 8
+BACKGROUND = (255, 255, 255)
+
+# Size of the tiles of the field as loaded, before any zoom.
+tile_width, tile_height = TILE_SIZE
+
+
+@lru_cache(maxsize=None)
+def assets():
+    # The atlas of the images of the game, loaded on first use.
+    return load_atlas()
+
+
+def parse_args(argv=None):
+    parser = ArgumentParser(description='Yet Another Minesweeper Game.')
+    parser.add_argument('--field_width', type=int, default=MIN_FIELD_WIDTH,
+                        help="the number of columns in the field.")
+    parser.add_argument('--field_height', type=int, default=MIN_FIELD_HEIGHT,
+                        help="the number of rows in the field.")
+    parser.add_argument('--field_mines', type=int, default=MIN_FIELD_MINES, help='the number of mines in the field.')
+    parser.add_argument('--advanced_solver', action='store_true',
+                        help='use the solver which also reasons on probabilities and guesses when stuck.')
+    parser.add_argument('--autoplay_rate', type=float, default=10.0,
+                        help='the number of moves per second the solver plays, once A is pressed.')
+    parser.add_argument('--chunked', action='store_true',
+                        help='generate the mines a chunk at a time as the field is played, for very large fields.')
+    parser.add_argument('--no_guess', action='store_true',
+                        help='only play boards which can be solved from the first square without guessing.')
+    parser.add_argument('--profile', default=None,
+                        help='measure the game and the frames, and write the timings to the given .json or .csv file '
+                             'on exit. Press F3 to show the frame times.')
+    parser.add_argument('--record', default=None,
+                        help='append the moves of the player and the solver to the given binary move log, '
+                             'every game is then seeded so it can be replayed with the recording module.')
+    parser.add_argument('--snapshot', default=None,
+                        help='restore the game from the given snapshot file if it exists, press S to save it there.')
+    args = parser.parse_args(argv)
+    if args.chunked and (args.record or args.snapshot):
+        parser.error('chunked fields can not be recorded nor saved')
+    if args.no_guess and (args.chunked or args.record or args.snapshot):
+        # A restored snapshot is a plain game, it would silently leave the no guess mode.
+        parser.error('boards without guessing can not be chunked, recorded nor saved')
+
+    # Keep the field within the supported bounds.
+    args.field_width = max(args.field_width, MIN_FIELD_WIDTH)
+    args.field_height = max(args.field_height, MIN_FIELD_HEIGHT)
+    args.field_mines = min(args.field_width * args.field_height - 9, max(args.field_mines, MIN_FIELD_MINES))
+    args.autoplay_rate = max(args.autoplay_rate, 0.1)
+    return args
+
+
+class TileSet:
+    """ The tiles of the field scaled to a tile size.
+    Below DETAILED_TILE_SIZE the details can't be made out anyway, so each tile is a flat square of its average
+    colour instead, which still tells covered, uncovered, marked and mined regions apart when zoomed out. """
+
+    def __init__(self, size):
+        self.size = size
+        images = assets()
+        self.initial = self.scale(images['initial'])
+        self.empty = self.scale(images['empty'])
+        self.marked = self.scale(images['marked'])
+        self.uncertain = self.scale(images['uncertain'])
+        self.mine = self.scale(images['mine'])
+        self.selected_mine = self.scale(images['selected_mine'])
+        self.wrong_marked = self.scale(images['wrong_marked'])
+        self.neighbours = {count: self.scale(images[f'neighbours_{count}']) for count in range(1, 9)}
+        self.lookups = {}
+
+    def scale(self, tile):
+        if self.size == tile.get_width():
+            return tile
+        if self.size < DETAILED_TILE_SIZE:
+            flat = pygame.Surface((self.size, self.size))
+            flat.fill(pygame.transform.average_color(tile))
+            return flat
+        return pygame.transform.smoothscale(tile.convert(), (self.size, self.size))
+
+    def lookup(self, game_state):
+        # Returns the list of the tiles of squares in the given game state,
+        # indexed by the flags of the square | its neighbouring mines << 4.
+        if game_state not in self.lookups:
+            self.lookups[game_state] = [square_tile(self, index & 15, index >> 4, game_state) for index in range(144)]
+        return self.lookups[game_state]
+
+
+@lru_cache(maxsize=None)
+def tile_set(size):
+    return TileSet(size)
+
+
+def square_tile(tiles, flags, neighbouring_mines, game_state):
+    # Returns the tile of a square based on its flags (marked/ uncertain) and game state.
+    if game_state == GAME_OVER or game_state == WINNER:
+        if flags & MINE_FLAG:
+            if flags & MARKED_FLAG:
+                return tiles.marked
+            if flags & UNCOVERED_FLAG:
+                return tiles.selected_mine
+            return tiles.mine if game_state == GAME_OVER else tiles.marked
+        if flags & MARKED_FLAG:
+            return tiles.wrong_marked
+        if not flags & UNCOVERED_FLAG:
+            return tiles.initial
+    if flags & UNCOVERED_FLAG:
+        return tiles.neighbours[neighbouring_mines] if neighbouring_mines else tiles.empty
+    return tiles.marked if flags & MARKED_FLAG else tiles.uncertain if flags & UNCERTAIN_FLAG else tiles.initial
+
+
+class FieldRenderer:
+    """ Draws the part of the field shown by the viewport, keeping it on a persistent surface of the size of the
+    viewport. Only the squares the minesweeper reports as changed are redrawn, and on scrolling the surface is shifted
+    and only the uncovered strips are drawn, so the cost of a frame depends on what is shown and not on the size of
+    the field. draw returns the rectangles of the window which were updated, to be passed on to
+    pygame.display.update. """
+
+    # Redraw the whole viewport instead of more changed squares than this.
+    max_changed_squares = 256
+
+    def __init__(self, minesweeper, viewport):
+        self.minesweeper = minesweeper
+        self.viewport = viewport
+        self.surface = pygame.Surface(viewport.size)
+        # Positions to redraw on next draw, None when the whole field has to be redrawn.
+        self.dirty = None
+        # The (scroll, tile size) the surface was drawn at.
+        self.view = None
+        minesweeper.add_listener(self.on_change)
+
+    def on_change(self, positions):
+        if positions is None or self.dirty is None:
+            self.dirty = None
         else:
-            if not square.uncovered:
-                surface.blit(marked_tile if square.marked else uncertain_tile if square.uncertain else initial_tile,
-                             blit_position)
-
-    win.blit(surface, offset)
+            self.dirty.update(positions)
+
+    def invalidate(self):
+        self.dirty = None
+
+    def draw_area(self, area, tiles):
+        # Draws the squares shown in the given area of the surface, clipped to it.
+        viewport, field = self.viewport, self.minesweeper.field
+        flags, counts, height = field.flags, field.counts, field.height
+        lookup = tiles.lookup(self.minesweeper.game_state)
+        tile_w, tile_h = viewport.tile_size
+        scroll_x, scroll_y = viewport.scroll
+        xs, ys = viewport.visible_squares(area)
+        self.surface.set_clip(area)
+        self.surface.fill(BACKGROUND, area)
+        self.surface.blits([(lookup[flags[x * height + y] | counts[x * height + y] << 4],
+                             (x * tile_w - scroll_x, y * tile_h - scroll_y)) for x in xs for y in ys], doreturn=False)
+        self.surface.set_clip(None)
+
+    def draw(self, win):
+        viewport = self.viewport
+        width, height = viewport.size
+        tile_w, tile_h = viewport.tile_size
+        scroll_x, scroll_y = viewport.scroll
+        view = viewport.scroll, viewport.tile_size
+        whole = pygame.Rect(0, 0, width, height)
+        redraw_all = self.dirty is None or self.view is None or self.view[1] != viewport.tile_size
+        areas = []
+        if not redraw_all and self.view[0] != viewport.scroll:
+            dx, dy = scroll_x - self.view[0][0], scroll_y - self.view[0][1]
+            if abs(dx) >= width or abs(dy) >= height:
+                redraw_all = True
+            else:
+                # Shift what is already drawn, and draw only the strips scrolled into view.
+                self.surface.scroll(-dx, -dy)
+                if dx:
+                    areas.append(pygame.Rect(width - dx, 0, dx, height) if dx > 0 else pygame.Rect(0, 0, -dx, height))
+                if dy:
+                    areas.append(pygame.Rect(0, height - dy, width, dy) if dy > 0 else pygame.Rect(0, 0, width, -dy))
+        scrolled = bool(areas)
+        if not redraw_all:
+            for x, y in self.dirty:
+                area = pygame.Rect(x * tile_w - scroll_x, y * tile_h - scroll_y, tile_w, tile_h).clip(whole)
+                if area.width and area.height:
+                    areas.append(area)
+            redraw_all = len(areas) > self.max_changed_squares
+        self.dirty = set()
+        self.view = view
+
+        tiles = tile_set(tile_w)
+        if redraw_all:
+            self.draw_area(whole, tiles)
+            return [win.blit(self.surface, viewport.offset)]
+        for area in areas:
+            self.draw_area(area, tiles)
+        if scrolled:
+            return [win.blit(self.surface, viewport.offset)]
+        rects = [win.blit(self.surface, (viewport.offset[0] + area.x, viewport.offset[1] + area.y), area)
+                 for area in areas]
+        if len(rects) > 64:
+            # A single rectangle covering a large flood is cheaper to update than hundreds of small ones.
+            rects = [rects[0].unionall(rects[1:])]
+        return rects
+
+
+def zoom(viewport, steps, pixel=None):
+    # Zooms the viewport the given number of ZOOM_LEVELS in (positive) or out (negative).
+    current = min(range(len(ZOOM_LEVELS)), key=lambda level: abs(ZOOM_LEVELS[level] - viewport.tile_size[0]))
+    size = ZOOM_LEVELS[max(0, min(len(ZOOM_LEVELS) - 1, current + steps))]
+    viewport.zoom_to((size, size), pixel)
+
+
+def handle_view(event, viewport):
+    # This function scrolls the viewport with the arrow keys, the mouse wheel (horizontally with shift)
+    # and dragging with the middle button, and zooms with + and - or the mouse wheel with ctrl.
+    step = 4 * viewport.tile_size[0]
+    if event.type == pygame.KEYDOWN:
+        if event.key == pygame.K_LEFT:
+            viewport.scroll_by(-step, 0)
+        elif event.key == pygame.K_RIGHT:
+            viewport.scroll_by(step, 0)
+        elif event.key == pygame.K_UP:
+            viewport.scroll_by(0, -step)
+        elif event.key == pygame.K_DOWN:
+            viewport.scroll_by(0, step)
+        elif event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+            zoom(viewport, 1)
+        elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+            zoom(viewport, -1)
+    elif event.type == pygame.MOUSEWHEEL:
+        mods = pygame.key.get_mods()
+        if mods & pygame.KMOD_CTRL:
+            zoom(viewport, event.y, pygame.mouse.get_pos())
+        elif mods & pygame.KMOD_SHIFT:
+            viewport.scroll_by(-event.y * step, 0)
+        else:
+            viewport.scroll_by(-event.x * step, -event.y * step)
+    elif event.type == pygame.MOUSEMOTION and event.buttons[1]:
+        viewport.scroll_by(-event.rel[0], -event.rel[1])
 
 
 def number_surface(number):
     # Return a surface blitted with digits corresponding to the given integer.
-    # It has a limit of numbers between -99 to 999
+    # It has a limit of numbers between -99 to 999, the number is clamped before looking up the cache
+    # so that it never holds more than a surface per number which can be shown.
+    return _number_surface(max(-99, min(number, 999)))
+
+
+@lru_cache(maxsize=None)
+def _number_surface(number):
+    images = assets()
+    digit_width, digit_height = images.size('minus')
     surf = pygame.Surface((3 * digit_width, digit_height))
-    number = max(-99, min(number, 999))
     digit2, digit3 = (abs(number) % 100) // 10, (abs(number) % 10)
-    surf.blit(minus_image if number < 0 else digit_images[number // 100], (0, 0))
-    surf.blit(digit_images[digit2], (digit_width, 0))
-    surf.blit(digit_images[digit3], (digit_width * 2, 0))
+    surf.blit(images['minus'] if number < 0 else images[f'digit_{number // 100}'], (0, 0))
+    surf.blit(images[f'digit_{digit2}'], (digit_width, 0))
+    surf.blit(images[f'digit_{digit3}'], (digit_width * 2, 0))
     return surf
 
 
-def handle_clicks(event, minesweeper, offset=(0, 0)):
+def record_move(log, minesweeper, kind, position, changed, source=PLAYER):
+    # Records the move to the move log, when recording and the move changed the field.
+    if log is not None and changed:
+        log.record(minesweeper, kind, position, source)
+
+
+def play_solver_move(minesweeper, move, log=None):
+    # Plays the move of the solver on the minesweeper.
+    position, operation = move
+    if operation == MARK:
+        print(f'[AI] MARK {position[0]}, {position[1]}')
+        record_move(log, minesweeper, MARK_MOVE, position, minesweeper.toggle(position, force_mark=True), SOLVER)
+    elif operation == UNCOVER:
+        print(f'[AI] UNCOVER {position[0]}, {position[1]}')
+        record_move(log, minesweeper, UNCOVER_MOVE, position, minesweeper.uncover(position), SOLVER)
+
+
+def reset_game(minesweeper, log=None):
+    # Resets the minesweeper, when recording the new game is seeded and its seed recorded.
+    if log is None:
+        minesweeper.reset()
+    else:
+        seed = minesweeper.random.getrandbits(64)
+        minesweeper.reset(seed=seed)
+        log.reset(seed)
+
+
+def handle_clicks(event, minesweeper, viewport, log=None):
     # This function handles clicks on the minesweeper.
-    # Calls appropriate method on the minesweeper and specified the position base on click location
+    # Calls appropriate method on the minesweeper and specified the position base on click location,
+    # which the viewport maps directly to a square of the field.
     # This function calls uncover on LEFT click on covered location and
     # uncover_neighbours on LEFT click on uncovered location. It calls toggle on RIGHT click.
     if event.type == pygame.MOUSEBUTTONDOWN:
-        for position in minesweeper.field:
-            if 0 < event.pos[0] - position[0] * tile_width - offset[0] < tile_width and \
-                    0 < event.pos[1] - position[1] * tile_height - offset[1] < tile_height:
-                if event.button == 1:
-                    if not minesweeper.field[position].uncovered:
-                        print(f'UNCOVER {position[0]}, {position[1]}')
-                        minesweeper.uncover(position)
-                    else:
-                        print(f'UNCOVER NEIGHBOURS {position[0]}, {position[1]}')
-                        minesweeper.uncover_neighbours(position)
-                    return True
-                elif event.button == 3:
-                    print(f'TOGGLE {position[0]}, {position[1]}')
-                    minesweeper.toggle(position)
-                    return True
+        position = viewport.field_position(event.pos)
+        if position is not None:
+            if event.button == 1:
+                if not minesweeper.field[position].uncovered:
+                    print(f'UNCOVER {position[0]}, {position[1]}')
+                    record_move(log, minesweeper, UNCOVER_MOVE, position, minesweeper.uncover(position))
+                else:
+                    print(f'UNCOVER NEIGHBOURS {position[0]}, {position[1]}')
+                    record_move(log, minesweeper, UNCOVER_NEIGHBOURS_MOVE, position,
+                                minesweeper.uncover_neighbours(position))
+                return True
+            elif event.button == 3:
+                print(f'TOGGLE {position[0]}, {position[1]}')
+                record_move(log, minesweeper, TOGGLE_MOVE, position, minesweeper.toggle(position))
+                return True
     return False
 
 def draw_smiley(win, minesweeper, offset):
     # This function draws the corresponding image based on game state on the window at specified offset.
     if minesweeper.game_state == INIT or minesweeper.game_state == PROGRESS:
-        win.blit(progress_smiley, offset)
+        win.blit(assets()['progress_smiley'], offset)
     elif minesweeper.game_state == GAME_OVER:
-        win.blit(game_over_smiley, offset)
+        win.blit(assets()['game_over_smiley'], offset)
     elif minesweeper.game_state == WINNER:
-        win.blit(winner_smiley, offset)
+        win.blit(assets()['winner_smiley'], offset)
 
 
-def handle_click_smiley(event, minesweeper, offset):
+def handle_click_smiley(event, minesweeper, offset, log=None):
     # This function calls reset on minesweeper when smiley is clicked.
     # Also returns whether reset was called or not.
     if event.type == pygame.MOUSEBUTTONDOWN:
-        if 0 < event.pos[0] - offset[0] < digit_width and \
-                0 < event.pos[1] - offset[1] < digit_height:
-            minesweeper.reset()
+        if local_position(event.pos, offset, assets().size('minus')) is not None:
+            reset_game(minesweeper, log)
             # Indicate that click has been handled
             print('RESET')
             return True
     return False
 
 
-def main_loop():
-    # Obtain the width and height of the screen.
-    width = field_width * tile_width + 10
-    height = field_height * tile_height + digit_height + 15
+class HeaderRenderer:
+    """ Draws the number of pending mines, the time and the smiley, only when any of them changed since last draw.
+    draw returns the rectangles of the window which were updated. """
+
+    def __init__(self, width, smiley_offset):
+        self.width = width
+        self.smiley_offset = smiley_offset
+        self.shown = None
+
+    def invalidate(self):
+        self.shown = None
+
+    def draw(self, win, minesweeper):
+        shown = minesweeper.pending_mines(), minesweeper.time_progressed(), minesweeper.game_state
+        if shown == self.shown:
+            return []
+        self.shown = shown
+        header_rect = pygame.Rect(0, 0, self.width, assets().size('minus')[1] + 10)
+        win.fill((255, 255, 255), header_rect)
+        # Render the time and number of mines.
+        count_surf = number_surface(minesweeper.pending_mines())
+        win.blit(count_surf, (5, 5))
+        time_surf = number_surface(minesweeper.time_progressed())
+        time_rect = time_surf.get_rect()
+        win.blit(time_surf, (self.width - time_rect.width - 5, 5))
+        # Render the smiley
+        draw_smiley(win, minesweeper, offset=self.smiley_offset)
+        return [header_rect]
+
+
+def idle_timeout(minesweeper):
+    # Returns the milliseconds until the shown time changes, or None if the time is not running.
+    if minesweeper.game_state != PROGRESS:
+        return None
+    return 1000 - int((time() - minesweeper.start_time) * 1000) % 1000
+
+
+class FrameOverlay:
+    """ Shows the frame times measured by the instrumentation in the bottom left corner of the window,
+    refreshed a couple of times per second. """
+
+    phases = ('frame', 'frame.events', 'frame.render', 'frame.update')
+
+    def __init__(self):
+        self.font = None
+        self.drawn_at = 0
+
+    def draw(self, win):
+        if perf_counter() - self.drawn_at < 0.5:
+            return []
+        self.drawn_at = perf_counter()
+        if self.font is None:
+            self.font = pygame.font.Font(None, 18)
+        lines = []
+        for phase in self.phases:
+            histogram = instrumentation.histograms.get(phase)
+            if histogram is not None:
+                lines.append(f'{phase} mean {histogram.mean * 1000:.2f}ms '
+                             f'p99 {histogram.percentile(0.99) * 1000:.2f}ms')
+        surfaces = [self.font.render(line, True, (255, 255, 255)) for line in lines or ['no frames yet']]
+        width = max(surface.get_width() for surface in surfaces) + 6
+        height = sum(surface.get_height() for surface in surfaces) + 6
+        rect = pygame.Rect(0, win.get_height() - height, width, height)
+        win.fill((0, 0, 0), rect)
+        y = rect.y + 3
+        for surface in surfaces:
+            win.blit(surface, (3, y))
+            y += surface.get_height()
+        return [rect]
+
+
+def main_loop(args):
+    if args.chunked:
+        minesweeper = ChunkedMineSweeper(args.field_width, args.field_height, args.field_mines)
+    elif args.snapshot and os.path.exists(args.snapshot):
+        minesweeper = load_snapshot(args.snapshot)
+    elif args.no_guess:
+        # The boards are searched on other processes while playing, and are ready by the next game.
+        minesweeper = NoGuessMineSweeper(args.field_width, args.field_height, args.field_mines,
+                                         generator=BoardGenerator())
+    else:
+        minesweeper = MineSweeper(args.field_width, args.field_height, args.field_mines)
+    log = None
+    if args.record:
+        log = MoveLog(args.record, minesweeper.field_width, minesweeper.field_height, minesweeper.field_mines)
+        # The restored game was not recorded from its start, its moves are recorded from the next game on.
+        if minesweeper.game_state == INIT:
+            reset_game(minesweeper, log)
+
+    digit_height = assets().size('minus')[1]
+    # Obtain the width and height of the screen, the field is scrolled if it does not fit.
+    info = pygame.display.Info()
+    max_width, max_height = (info.current_w - 40, info.current_h - 80) if info.current_w > 0 and info.current_h > 0 \
+        else DEFAULT_MAX_WINDOW_SIZE
+    view_size = (max(MIN_FIELD_WIDTH * tile_width, min(minesweeper.field_width * tile_width, max_width - 10)),
+                 max(MIN_FIELD_HEIGHT * tile_height,
+                     min(minesweeper.field_height * tile_height, max_height - digit_height - 15)))
+    width = view_size[0] + 10
+    height = view_size[1] + digit_height + 15
     smiley_offset = (width // 2 - digit_height // 2, 5)
 
     win = pygame.display.set_mode((width, height))
     pygame.display.set_caption('Minesweeper')
+    assets().convert()
+    win.fill((255, 255, 255))
+    pygame.display.update()
     clock = pygame.time.Clock()
 
-    minesweeper = MineSweeper(field_width, field_height, field_mines)
-    steps = solver(minesweeper)
+    viewport = Viewport(offset=(5, digit_height + 10), size=view_size, tile_size=(tile_width, tile_height),
+                        field_size=minesweeper.field_size)
+    # The solver runs on a thread, following the changes on the minesweeper by itself,
+    # keeping only the squares played of chunked fields which are too large to copy.
+    worker = SolverWorker(minesweeper, advanced=args.advanced_solver, sparse=args.chunked)
+    # Moves asked for with N and not played yet, and when the next move is due while autoplaying.
+    requested = 0
+    autoplay_at = None
+    field_renderer = FieldRenderer(minesweeper, viewport)
+    pygame.key.set_repeat(300, 30)
+    header_renderer = HeaderRenderer(width, smiley_offset)
+    overlay = None
+    if args.profile:
+        instrumentation.enable()
 
     run = True
+    idle = False
     while run:
-        for event in pygame.event.get():
+        events = pygame.event.get()
+        if not events and idle:
+            # Nothing changed on the last frame, so instead of redrawing sleep until an event arrives
+            # or the shown time changes.
+            timeout = idle_timeout(minesweeper)
+            if autoplay_at is not None and worker.busy():
+                autoplay_timeout = max(1, int((autoplay_at - perf_counter()) * 1000))
+                timeout = autoplay_timeout if timeout is None else min(timeout, autoplay_timeout)
+            event = pygame.event.wait() if timeout is None else pygame.event.wait(timeout)
+            events = [event] if event.type != pygame.NOEVENT else []
+
+        # Time spent waiting for events is not part of the frame.
+        measured = instrumentation.enabled
+        frame_start = perf_counter() if measured else 0
+        for event in events:
             if (event.type == pygame.QUIT or
                     (event.type == pygame.KEYDOWN and event.key in [pygame.K_q, pygame.K_ESCAPE])):
                 run = False
+            if event.type == pygame.VIDEOEXPOSE:
+                # The window contents may have been lost, draw everything again.
+                win.fill((255, 255, 255))
+                field_renderer.invalidate()
+                header_renderer.invalidate()
+            handle_view(event, viewport)
             # Handle mouse clicks.
-            if handle_clicks(event, minesweeper, offset=(5, digit_height + 10)):
-                # On user input, just in case reset the solver.
-                steps = solver(minesweeper)
-
-            if handle_click_smiley(event, minesweeper, offset=smiley_offset):
-                # On reset, create a new solver.
-                steps = solver(minesweeper)
+            # The moves the solver computed so far are dropped once the player makes a move of their own.
+            if handle_clicks(event, minesweeper, viewport, log):
+                worker.cancel()
+                requested = 0
+            handle_click_smiley(event, minesweeper, offset=smiley_offset, log=log)
 
             if event.type == pygame.KEYDOWN and event.key == pygame.K_r:
                 # Reset the minesweeper.
-                minesweeper.reset()
+                reset_game(minesweeper, log)
                 print('RESET')
-                steps = solver(minesweeper)
 
-            if event.type == pygame.KEYDOWN and event.key == pygame.K_n:
-                # Try twice if in case generator was exhausted in which case we use a newer one.
-                # If solver can't solve it in second try don't simply keep calling it.
-                tries = 0
-                while tries <= 1:
-                    try:
-                        # Obtain the step from the solver.
-                        position, operation = next(steps)
-                        if operation == MARK:
-                            print(f'[AI] MARK {position[0]}, {position[1]}')
-                            minesweeper.toggle(position, force_mark=True)
-                        elif operation == UNCOVER:
-                            print(f'[AI] UNCOVER {position[0]}, {position[1]}')
-                            minesweeper.uncover(position)
-                        break
-                    except StopIteration:
-                        # reset the solver in case previous one exhausted and check if it can solve
-                        steps = solver(minesweeper)
-                        tries += 1
-
-        win.fill((255, 255, 255))
-        # Render the time and number of mines.
-        count_surf = number_surface(minesweeper.pending_mines())
-        win.blit(count_surf, (5, 5))
-        time_surf = number_surface(minesweeper.time_progressed())
-        time_rect = time_surf.get_rect()
-        win.blit(time_surf, (width - time_rect.width - 5, 5))
-        # Render the smiley
-        draw_smiley(win, minesweeper, offset=smiley_offset)
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_s and args.snapshot:
+                save_snapshot(args.snapshot, minesweeper)
+                print(f'SAVED {args.snapshot}')
 
-        # Render the minesweeper field
-        draw_minesweeper(win, minesweeper, offset=(5, digit_height + 10))
-        pygame.display.update()
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_n:
+                # The move is played as soon as the solver has one, which is usually right away.
+                requested += 1
+
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_a:
+                # Toggle playing the moves of the solver at the autoplay rate.
+                autoplay_at = perf_counter() if autoplay_at is None else None
+                print('AUTOPLAY ON' if autoplay_at is not None else 'AUTOPLAY OFF')
+
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                # Toggle the frame time overlay, measuring from now on if not yet.
+                # Measuring stops along with the overlay, unless profiling the whole run.
+                if overlay is None:
+                    if not instrumentation.enabled:
+                        instrumentation.reset()
+                        instrumentation.enable()
+                    overlay = FrameOverlay()
+                else:
+                    overlay = None
+                    if not args.profile:
+                        instrumentation.disable()
+                    win.fill((255, 255, 255))
+                    field_renderer.invalidate()
+                    header_renderer.invalidate()
+
+        # Play the moves asked for and those due while autoplaying, if the solver has them.
+        while requested or (autoplay_at is not None and perf_counter() >= autoplay_at):
+            move = worker.take()
+            if move is None:
+                if not worker.busy():
+                    # The solver is stuck until the field changes.
+                    requested = 0
+                break
+            play_solver_move(minesweeper, move, log)
+            if requested:
+                requested -= 1
+            else:
+                autoplay_at = max(autoplay_at + 1 / args.autoplay_rate, perf_counter() - 1 / args.autoplay_rate)
+        if autoplay_at is not None and minesweeper.game_over():
+            autoplay_at = None
+            print('AUTOPLAY OFF')
+
+        if measured:
+            render_start = perf_counter()
+            instrumentation.record('frame.events', render_start - frame_start)
+        # Render the header and only the squares of the field which changed.
+        rects = header_renderer.draw(win, minesweeper)
+        rects += field_renderer.draw(win)
+        if overlay is not None:
+            rects += overlay.draw(win)
+        if measured:
+            update_start = perf_counter()
+            instrumentation.record('frame.render', update_start - render_start)
+        if rects:
+            pygame.display.update(rects)
+        if measured:
+            frame_end = perf_counter()
+            instrumentation.record('frame.update', frame_end - update_start)
+            instrumentation.record('frame', frame_end - frame_start)
+            instrumentation.count('frame.drawn' if rects else 'frame.idle')
+        # Keep polling while waiting for the solver to come up with the moves asked for.
+        idle = not rects and not requested
         clock.tick(60)
 
+    worker.close()
+    if args.profile:
+        instrumentation.dump(args.profile)
+    if log is not None:
+        log.close()
+    if isinstance(minesweeper, NoGuessMineSweeper):
+        minesweeper.generator.close()
+
+def main(argv=None):
+    args = parse_args(argv)
+    pygame.init()
+    main_loop(args)
+
+
 if __name__ == '__main__':
-    main_loop()
+    main()
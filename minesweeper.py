@@ -1,4 +1,9 @@
-from random import sample
+import operator
+from collections import deque
+from collections.abc import Mapping
+from functools import lru_cache
+from itertools import compress
+from random import Random
 from time import time
 
 INIT = 'INIT'
@@ -6,16 +11,105 @@ PROGRESS = 'PROGRESS'
 WINNER = 'WINNER'
 GAME_OVER = 'GAME_OVER'
 
+# Operations of the moves given to apply_moves, as yielded by the solvers.
+MARK = 'MARK'
+UNCOVER = 'UNCOVER'
+
+
+# Flags of a square, packed into a single byte per square of the field.
+MINE_FLAG = 1
+UNCOVERED_FLAG = 2
+MARKED_FLAG = 4
+UNCERTAIN_FLAG = 8
+# Maps any non zero byte to the mine flag.
+_MINE_FLAG_TABLE = bytes([0] + [MINE_FLAG] * 255)
+# Map the flags of a square to 1 if it is marked, or uncertain.
+_MARKED_TABLE = bytes(1 if flags & MARKED_FLAG else 0 for flags in range(256))
+_UNCERTAIN_TABLE = bytes(1 if flags & UNCERTAIN_FLAG else 0 for flags in range(256))
+# Squares with any of these flags are not uncovered by a click.
+_UNCOVER_BLOCKING_FLAGS = UNCOVERED_FLAG | MARKED_FLAG | UNCERTAIN_FLAG
+# Map the flags of a square to 1 if it was played, uncovered, marked or uncertain.
+_PLAYED_TABLE = bytes(1 if flags & _UNCOVER_BLOCKING_FLAGS else 0 for flags in range(256))
+
+
+# Fields up to this many squares keep a table of the neighbours of every square, larger ones compute them when asked.
+# The table takes a few hundred bytes per square, a lot more than the flags and counts of the square.
+_NEIGHBOUR_TABLE_SQUARES = 128 * 128
+
+
+class _Neighbours:
+    # The indices of the neighbours of every square, computed when asked instead of kept in a table.
+    __slots__ = ('width', 'height')
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+    def __getitem__(self, index):
+        width, h = self.width, self.height
+        x, y = divmod(index, h)
+        if 0 < x < width - 1 and 0 < y < h - 1:
+            # Squares away from the border all have their neighbours at the same offsets.
+            return index + h - 1, index + h, index + h + 1, index - h - 1, index - h, index - h + 1, index - 1, index + 1
+        potential_neighbours = [(x + 1, y - 1), (x + 1, y), (x + 1, y + 1), (x - 1, y - 1), (x - 1, y),
+                                (x - 1, y + 1), (x, y - 1), (x, y + 1)]
+        return tuple(nx * h + ny for nx, ny in potential_neighbours if 0 <= nx < width and 0 <= ny < h)
+
+    def __len__(self):
+        return self.width * self.height
+
+
+@lru_cache(maxsize=8)
+def _neighbour_table(width, height):
+    # For every square index, the tuple of the indices of its neighbours.
+    # It only depends on the size of the field, so it is computed once and shared by all fields of that size.
+    neighbours = _Neighbours(width, height)
+    return tuple(neighbours[index] for index in range(width * height))
+
+
+def _neighbours(width, height):
+    # Returns the neighbours of the squares of a field of the given size, a table if it is small enough.
+    if width * height <= _NEIGHBOUR_TABLE_SQUARES:
+        return _neighbour_table(width, height)
+    return _Neighbours(width, height)
+
+
+def _flag_property(flag):
+    # Builds a boolean property which reads and writes the given flag of the square.
+    def getter(self):
+        return bool(self._field.flags[self._index] & flag)
+
+    def setter(self, value):
+        if value:
+            self._field.update(self._index, set_flags=flag)
+        else:
+            self._field.update(self._index, clear_flags=flag)
+
+    return property(getter, setter)
+
 
 class _Square:
-    def __init__(self):
-        # Initial configurations.
-        self.mine = False
-        self.neighbouring_mines = 0
-        # Base on user input
-        self.uncovered = False
-        self.marked = False
-        self.uncertain = False
+    # A view of a single square of the field, all its state lives in the buffers of the field.
+    __slots__ = ('_field', '_index')
+
+    def __init__(self, field, index):
+        self._field = field
+        self._index = index
+
+    # Initial configurations.
+    mine = _flag_property(MINE_FLAG)
+    # Base on user input
+    uncovered = _flag_property(UNCOVERED_FLAG)
+    marked = _flag_property(MARKED_FLAG)
+    uncertain = _flag_property(UNCERTAIN_FLAG)
+
+    @property
+    def neighbouring_mines(self):
+        return self._field.counts[self._index]
+
+    @neighbouring_mines.setter
+    def neighbouring_mines(self, value):
+        self._field.counts[self._index] = value
 
     @property
     def neighbour_mines(self):
@@ -33,32 +127,156 @@ class _Square:
                f'marked: {self.marked}, uncertain: {self.uncertain} }}'
 
 
+class _Field(Mapping):
+    """ The field of squares, mapping (x, y) positions to squares.
+        Instead of an object per square, the field keeps two flat buffers with a byte per square,
+        one with the flags of the square and one with the number of neighbouring mines.
+        The square at (x, y) is stored at index x * height + y. """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        # The indices of the neighbours of every square.
+        self.neighbours = _neighbours(width, height)
+        self.reset()
+
+    def reset(self):
+        # Clears all squares at once, a freshly allocated buffer is zero filled.
+        self.flags = bytearray(self.width * self.height)
+        self.counts = bytearray(self.width * self.height)
+        # Number of squares marked and uncertain, kept up to date by update.
+        self.marked = 0
+        self.uncertain = 0
+
+    def load(self, flags, counts):
+        # Replaces the flags and the neighbouring mines of all squares with the given bytes-like objects,
+        # a byte per square in the order of the field, and counts the marked and uncertain squares again.
+        flags, counts = bytearray(flags), bytearray(counts)
+        if len(flags) != len(self.flags) or len(counts) != len(self.flags):
+            raise ValueError(f'expected {len(self.flags)} squares, got {len(flags)} flags and {len(counts)} counts')
+        self.flags = flags
+        self.counts = counts
+        self.marked = len(flags) - flags.translate(_MARKED_TABLE).count(0)
+        self.uncertain = len(flags) - flags.translate(_UNCERTAIN_TABLE).count(0)
+
+    def update(self, index, set_flags=0, clear_flags=0):
+        # Sets and clears the given flags of a square, keeping the counters of marked and uncertain squares.
+        # Returns whether the square changed.
+        old = self.flags[index]
+        new = (old | set_flags) & ~clear_flags
+        if new == old:
+            return False
+        self.flags[index] = new
+        flipped = old ^ new
+        if flipped & MARKED_FLAG:
+            self.marked += 1 if new & MARKED_FLAG else -1
+        if flipped & UNCERTAIN_FLAG:
+            self.uncertain += 1 if new & UNCERTAIN_FLAG else -1
+        return True
+
+    def played(self):
+        # Returns the indices of the squares uncovered, marked or uncertain, in the order of the field.
+        return list(compress(range(len(self.flags)), self.flags.translate(_PLAYED_TABLE)))
+
+    def covered(self):
+        # Yields the indices of the squares neither uncovered nor marked, in the order of the field.
+        return (index for index, flags in enumerate(self.flags) if not flags & (UNCOVERED_FLAG | MARKED_FLAG))
+
+    def index(self, position):
+        x, y = position
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            raise KeyError(position)
+        return x * self.height + y
+
+    def position(self, index):
+        return divmod(index, self.height)
+
+    def __getitem__(self, position):
+        return _Square(self, self.index(position))
+
+    def __contains__(self, position):
+        try:
+            x, y = position
+        except (TypeError, ValueError):
+            return False
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def __iter__(self):
+        return map(self.position, range(len(self.flags)))
+
+    def __len__(self):
+        return len(self.flags)
+
+
 class MineSweeper:
-    def __init__(self, field_width, field_height, field_mines):
+    def __init__(self, field_width, field_height, field_mines, seed=None):
         field_mines = min(field_width * field_height - 9, max(0, field_mines))
         self.field_width = field_width
         self.field_height = field_height
         self.field_mines = field_mines
         self.field_size = field_width, field_height
         self.total_non_mines = self.field_width * self.field_height - self.field_mines
+        self.field = self.__new_field__()
+        self.listeners = []
+        # Mines are placed with this generator, seed it for reproducible games.
+        self.random = Random(seed)
+        # The seed of the current game, None when the game was not seeded.
+        self.seed = seed
         self.__reset__()
 
+    def __new_field__(self):
+        # Constructs the storage of the field.
+        return _Field(self.field_width, self.field_height)
+
     def __reset__(self):
-        # This methods constructs all fields which are mutated on operation.
-        self.field = {(x, y): _Square() for x in range(self.field_width) for y in range(self.field_height)}
+        # This methods resets all fields which are mutated on operation.
+        self.field.reset()
         self.uncovered = 0
         self.game_duration = 0
+        # Whether the mines were loaded, instead of being placed on the first uncover.
+        self.mines_loaded = False
         self.__update_state__(INIT)
+        self.__notify__(None)
 
-    def reset(self):
+    def reset(self, seed=None):
+        # Resets the game, when seed is given the mines of the next game only depend on it and the first position.
+        if seed is not None:
+            self.random.seed(seed)
+        self.seed = seed
+        self.__reset__()
+
+    def load_mines(self, mines, neighbouring_mines=None):
+        """ Resets the game with the given mines, which are used instead of placing random ones on the first uncover.
+        mines is a bytes-like object (a bytearray, or a contiguous numpy array of shape (field_width, field_height))
+        with a byte per square in the order of the field, the square at (x, y) at x * field_height + y,
+        non zero for a mine. neighbouring_mines is the same for the number of neighbouring mines,
+        and is computed from the mines when not given.
+        NOTE: the mines are used as they are, it is up to the caller to leave the first uncovered square mine free. """
         self.__reset__()
+        field = self.field
+        flags = bytearray(mines)
+        if len(flags) != len(field):
+            raise ValueError(f'expected {len(field)} squares, got {len(flags)}')
+        flags = flags.translate(_MINE_FLAG_TABLE)
+        if neighbouring_mines is None:
+            neighbouring_mines = bytearray(len(flags))
+            for index, mine in enumerate(flags):
+                if mine:
+                    for neighbour in field.neighbours[index]:
+                        neighbouring_mines[neighbour] += 1
+        field.load(flags, neighbouring_mines)
+        self.field_mines = len(field) - field.flags.count(0)
+        self.total_non_mines = len(field) - self.field_mines
+        self.mines_loaded = True
+        # The mines don't derive from any seed.
+        self.seed = None
 
     def __getitem__(self, position):
         # Just a utility to easy getting squares from the field
         return self.field[position]
 
     def __iter__(self):
-        return iter(self.field.keys())
+        return iter(self.field)
 
     def __bool__(self):
         # So that direct condition can be used to determine, if game in progress or not
@@ -70,29 +288,49 @@ class MineSweeper:
 
     def neighbours(self, field_pos):
         # Obtains the neighbouring positions of the given position
-        x, y = field_pos
-        potential_neighbours = [(x + 1, y - 1), (x + 1, y), (x + 1, y + 1), (x - 1, y - 1), (x - 1, y), (x - 1, y + 1),
-                                (x, y - 1), (x, y + 1)]
-        return list(filter(self._in_field, potential_neighbours))
+        return list(map(self.field.position, self.field.neighbours[self.field.index(field_pos)]))
 
     def __update_state__(self, state):
         self.game_state = state
 
+    def add_listener(self, listener):
+        """ Registers a function to be called with the list of positions which changed after each operation.
+        It is called with None instead, when the whole field has to be considered changed (on reset and game over,
+        since then mines and wrongly marked squares are revealed). """
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def __notify__(self, positions):
+        for listener in self.listeners:
+            listener(positions)
+
     def __init_game__(self, init_position):
         # This method is called when user selects the first position on the field,
-        # it ensures that all the neighbours of selected position are mine free and places the remaining mines
-        # accordingly. Updates the neighbouring_mines of squares.
+        # places the mines unless they were loaded.
         # Changes the state to PROGRESS and starts the timer.
-        potential_mine_positions = [(x, y) for x in range(self.field_width) for y in range(self.field_height)
-                                    if (x, y) != init_position and (x, y) not in self.neighbours(init_position)]
-        mine_positions = sample(potential_mine_positions, self.field_mines)
-        for position in mine_positions:
-            self[position].mine = True
-            for neighbour in self.neighbours(position):
-                self[neighbour].neighbouring_mines += 1
+        if not self.mines_loaded:
+            self.__place_mines__(init_position)
         self.start_time = time()
         self.__update_state__(PROGRESS)
 
+    def __place_mines__(self, init_position):
+        # Ensures that all the neighbours of selected position are mine free and places the remaining mines
+        # accordingly. Updates the neighbouring_mines of squares.
+        field, neighbours = self.field, self.field.neighbours
+        init_index = field.index(init_position)
+        safe_indices = sorted(neighbours[init_index] + (init_index,))
+        # Sample among the squares outside the safe zone without listing them,
+        # by shifting each sampled index past the safe squares before it.
+        for index in self.random.sample(range(len(field) - len(safe_indices)), self.field_mines):
+            for safe_index in safe_indices:
+                if index >= safe_index:
+                    index += 1
+            field.flags[index] |= MINE_FLAG
+            for neighbour in neighbours[index]:
+                field.counts[neighbour] += 1
+
     def __start_time(self):
         self.start_time = time()
 
@@ -111,84 +349,163 @@ class MineSweeper:
     def pending_mines(self):
         # This methods returns number of mines that have not been marked
         # can go to negative if user marks more mines than those existing
-        return self.field_mines - sum(map(lambda pos: self[pos].marked, self))
+        return self.field_mines - self.field.marked
+
+    def __uncover_squares__(self, positions, notify=True):
+        # Uncovers the given positions one after the other, stops as soon as the game is over.
+        # Regions of squares without neighbouring mines are flooded iteratively with a queue, instead of recursing
+        # once per square, so that large open regions are uncovered in a single pass.
+        # Listeners are notified of the change unless notify is False.
+        # Returns the list of positions which were uncovered.
+        field, neighbours = self.field, self.field.neighbours
+        flags, counts = field.flags, field.counts
+        changed = []
+        for position in positions:
+            if self.game_state != PROGRESS:
+                break
+            index = field.index(position)
+            # Clicking covered squares that are not marked nor uncertain, will only uncover the square.
+            if flags[index] & _UNCOVER_BLOCKING_FLAGS:
+                continue
+            flags[index] |= UNCOVERED_FLAG
+            changed.append(index)
+
+            if flags[index] & MINE_FLAG:
+                # If uncovered a mine
+                self.__update_state__(GAME_OVER)
+                self.__stop_time()
+                break
+
+            self.uncovered += 1
+            queue = deque()
+            if not counts[index]:
+                queue.append(index)
+            while queue:
+                # Neighbours of a square without neighbouring mines are never mines,
+                # so these can be uncovered right away. Marked and uncertain squares are left alone.
+                for neighbour_index in neighbours[queue.popleft()]:
+                    if not flags[neighbour_index] & _UNCOVER_BLOCKING_FLAGS:
+                        flags[neighbour_index] |= UNCOVERED_FLAG
+                        changed.append(neighbour_index)
+                        self.uncovered += 1
+                        if not counts[neighbour_index]:
+                            queue.append(neighbour_index)
+
+            if self.uncovered >= self.total_non_mines:
+                # If all non-mine squares uncovered.
+                self.__update_state__(WINNER)
+                self.__stop_time()
+                break
+        changed = [field.position(index) for index in changed]
+        if changed and notify:
+            self.__notify__(None if self.game_over() else changed)
+        return changed
 
     def uncover(self, position):
+        """ This function uncovers the given position, and the whole region around it if it has no neighbouring mines.
+        Returns the list of positions which were uncovered. """
         if self.game_state == INIT:
             self.__init_game__(init_position=position)
             # After initialization it goes into progress.
-
-        if self.game_state == PROGRESS:
-            # Clicking covered squares that are not marked nor uncertain,
-            # will only uncover the square.
-            if not self[position].uncovered and \
-                    not self[position].marked and \
-                    not self[position].uncertain:
-                self[position].uncover()
-                # After uncovering, determine the next set of actions, base on uncovered square
-
-                if self[position].mine:
-                    # If uncovered a mine
-                    self.__update_state__(GAME_OVER)
-                    self.__stop_time()
-                    return
-
-                self.uncovered += 1
-                if self.uncovered >= self.total_non_mines:
-                    # If all non-mine squares uncovered.
-                    self.__update_state__(WINNER)
-                    self.__stop_time()
-                    return
-
-                if not self[position].neighbour_mines:
-                    for neighbour in self.neighbours(position):
-                        # Remove flags on the neighbour to facilitate uncovering
-                        # because of the above conditions to prevent mistakenly uncovering
-                        # marked positions.
-                        self[position].marked = False
-                        self[position].uncertain = False
-                        self.uncover(neighbour)
+        return self.__uncover_squares__((position,))
 
     def toggle(self, position, force_mark=False):
         """ This function is used to toggle a covered position to marked or uncertain or not flagged state.
-        force_mark marks the position irrespective of previous state. """
+        force_mark marks the position irrespective of previous state.
+        Returns the list of positions which changed. """
         if self.game_state == PROGRESS:
-            if not self[position].uncovered:
+            field = self.field
+            index = field.index(position)
+            flags = field.flags[index]
+            if not flags & UNCOVERED_FLAG:
                 if not force_mark:
                     """ TOGGLE in a sequence INITIAL -> MARKED -> UNCERTAIN """
-                    if self[position].marked:
-                        self[position].marked = False
-                        self[position].uncertain = True
-                    elif self[position].uncertain:
-                        self[position].marked = False
-                        self[position].uncertain = False
+                    if flags & MARKED_FLAG:
+                        changed = field.update(index, set_flags=UNCERTAIN_FLAG, clear_flags=MARKED_FLAG)
+                    elif flags & UNCERTAIN_FLAG:
+                        changed = field.update(index, clear_flags=MARKED_FLAG | UNCERTAIN_FLAG)
                     else:
-                        self[position].marked = True
-                        self[position].uncertain = False
+                        changed = field.update(index, set_flags=MARKED_FLAG, clear_flags=UNCERTAIN_FLAG)
                 else:
                     """ Force mark """
-                    self[position].marked = True
-                    self[position].uncertain = False
+                    changed = field.update(index, set_flags=MARKED_FLAG, clear_flags=UNCERTAIN_FLAG)
+                if changed:
+                    self.__notify__([position])
+                    return [position]
+        return []
 
     def uncover_neighbours(self, position):
         """ This function uncovers all unmarked neighbours of mine neighbour
         when number of marked neighbours equals the neighbouring mines.
+        Returns the list of positions which were uncovered.
             NOTE: none of the neighbours must uncertain.
         """
         if self.game_state == PROGRESS:
-            if self[position].uncovered and self[position].neighbour_mines:
-                neighbours = self.neighbours(position)
-                marked_neighbour_mines = sum(map(lambda pos: self[pos].marked, neighbours))
-                if any(map(lambda pos: self[pos].uncertain, neighbours)):
-                    # If any of the neighbours are uncertain then return.
-                    return
-
-                if marked_neighbour_mines == self[position].neighbouring_mines:
+            field = self.field
+            flags = field.flags
+            index = field.index(position)
+            if flags[index] & UNCOVERED_FLAG and field.counts[index]:
+                neighbours = self.field.neighbours[index]
+                marked_neighbour_mines = 0
+                for neighbour in neighbours:
+                    if flags[neighbour] & UNCERTAIN_FLAG:
+                        # If any of the neighbours are uncertain then return.
+                        return []
+                    if flags[neighbour] & MARKED_FLAG:
+                        marked_neighbour_mines += 1
+
+                if marked_neighbour_mines == field.counts[index]:
                     # If number of marked mines matches the actual neighbouring mines
-                    unmarked_positions = [pos for pos in self.neighbours(position) if not self[pos].marked]
-                    for neighbour_position in unmarked_positions:
-                        # Uncover all the unmarked squares.
-                        self.uncover(neighbour_position)
+                    # uncover all the unmarked squares.
+                    return self.__uncover_squares__([field.position(neighbour) for neighbour in neighbours
+                                                     if not flags[neighbour] & MARKED_FLAG])
+        return []
+
+    def apply_moves(self, moves):
+        """ Applies the given moves one after the other, as (position, MARK or UNCOVER) like the solvers yield them,
+        where MARK marks the square whatever its state. Stops as soon as the game is over.
+        All the moves are checked before any is applied, raises ValueError if any is out of the field or unknown.
+        Listeners are notified once, of the changes of all the moves.
+        Returns the list of positions which changed, each listed once, and the resulting game state. """
+        field = self.field
+        checked = []
+        for position, operation in moves:
+            try:
+                # Coordinates have to be integers, field.index takes any number within the field.
+                x, y = position
+                position = operator.index(x), operator.index(y)
+                field.index(position)
+            except (TypeError, ValueError, KeyError):
+                raise ValueError(f'invalid move {operation!r} at {position!r}') from None
+            if operation not in (MARK, UNCOVER):
+                raise ValueError(f'invalid move {operation!r} at {position!r}')
+            checked.append((position, operation))
+
+        # Changed positions in order, as the keys of a dict so that each is only listed once.
+        changed = {}
+        # Consecutive uncovers are applied together, in a single pass of __uncover_squares__.
+        uncovers = []
+        for position, operation in checked:
+            if operation == UNCOVER:
+                if self.game_state == INIT:
+                    self.__init_game__(init_position=position)
+                uncovers.append(position)
+                continue
+            if uncovers:
+                changed.update(dict.fromkeys(self.__uncover_squares__(uncovers, notify=False)))
+                uncovers = []
+            if self.game_over():
+                break
+            index = field.index(position)
+            if self.game_state == PROGRESS and not field.flags[index] & UNCOVERED_FLAG \
+                    and field.update(index, set_flags=MARKED_FLAG, clear_flags=UNCERTAIN_FLAG):
+                changed[position] = None
+        if uncovers:
+            changed.update(dict.fromkeys(self.__uncover_squares__(uncovers, notify=False)))
+        changed = list(changed)
+        if changed:
+            self.__notify__(None if self.game_over() else changed)
+        return changed, self.game_state
 
     def game_over(self):
         return self.game_state == GAME_OVER or self.game_state == WINNER
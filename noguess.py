@@ -0,0 +1,193 @@
+""" Boards which can be solved from the first uncovered square without ever guessing.
+    Candidate boards are generated at random and played by the advanced solver, only the boards it wins without
+    a single guess are kept. The search runs on a pool of worker processes, filling a cache of boards per
+    configuration in the background so that a new game rarely waits for it. When it does, the search for its first
+    square runs on the pool too, in short batches over all the processes.
+    A board found for one first square plays exactly the same from any square of the region without neighbouring
+    mines uncovered around it, since uncovering any of these uncovers the whole region, so a cached board is used
+    whenever the first square of a game falls in its region. """
+import os
+from functools import partial
+from multiprocessing import Pool
+from random import Random
+from threading import Lock
+
+from minesweeper import MineSweeper, WINNER, MINE_FLAG
+from utilities import solver, MARK
+
+# Keeps only the mine flag, the mines of a board are the flags of its squares before the first uncover.
+_MINE_TABLE = bytes(flags & MINE_FLAG for flags in range(256))
+
+# Candidates checked by each process in a batch of the search for the first square of a game.
+_BATCH_ATTEMPTS = 20
+
+
+class Board:
+    """ A board solvable without guessing: the mines and neighbouring mines, a byte per square in the order of the
+    field, and the indices of the squares which uncover the same region as the first square it was solved from. """
+    __slots__ = ('mines', 'counts', 'opening')
+
+    def __init__(self, mines, counts, opening):
+        self.mines = mines
+        self.counts = counts
+        self.opening = opening
+
+
+# The game and solver checking candidates in each process, reused across candidates of the same configuration.
+_checker = {}
+
+
+def check_candidate(width, height, mines, seed, position):
+    """ Generates the board of the given seed with position as the first uncovered square,
+    and returns it as a Board if the advanced solver wins it without guessing, None otherwise. """
+    key = width, height, mines
+    if key not in _checker:
+        _checker.clear()
+        minesweeper = MineSweeper(width, height, mines)
+        _checker[key] = minesweeper, solver(minesweeper, advanced=True)
+    minesweeper, steps = _checker[key]
+    minesweeper.reset(seed=seed)
+    field = minesweeper.field
+    opening = frozenset(field.index(uncovered) for uncovered in minesweeper.uncover(position)
+                        if not field.counts[field.index(uncovered)])
+    while not minesweeper.game_over():
+        try:
+            move, operation = next(steps)
+        except StopIteration:
+            return None
+        if steps.guessed:
+            return None
+        if operation == MARK:
+            minesweeper.toggle(move, force_mark=True)
+        else:
+            minesweeper.uncover(move)
+    if minesweeper.game_state != WINNER:
+        return None
+    return Board(field.flags.translate(_MINE_TABLE), bytes(field.counts), opening)
+
+
+def search(task):
+    # Checks candidates until one is solvable, at most attempts of them, from the given first position
+    # or random ones when position is None. Returns the Board found or None.
+    width, height, mines, seed, position, attempts = task
+    random = Random(seed)
+    for _ in range(attempts):
+        first = position if position is not None else (random.randrange(width), random.randrange(height))
+        board = check_candidate(width, height, mines, random.getrandbits(64), first)
+        if board is not None:
+            return board
+    return None
+
+
+class BoardGenerator:
+    """ Searches boards solvable without guessing, and keeps up to cache_size of them per configuration.
+    The searches run on a pool of processes (as many as cores by default), started the first time fill is called.
+    With processes=0 nothing is searched in the background, boards are only generated when asked for. """
+
+    def __init__(self, processes=None, cache_size=8, attempts=100, seed=None):
+        self.processes = processes
+        self.cache_size = cache_size
+        # Candidates checked by a background search before it gives up.
+        self.attempts = attempts
+        self.random = Random(seed)
+        self.pool = None
+        # From (width, height, mines) to the list of cached boards, and to the number of searches running.
+        self.boards = {}
+        self.pending = {}
+        # The results of the searches are collected on a thread of the pool.
+        self.lock = Lock()
+
+    def fill(self, width, height, mines):
+        """ Starts searches in the background until the cache of the configuration would be full. """
+        if self.processes == 0:
+            return
+        if self.pool is None:
+            self.pool = Pool(self.processes)
+        config = width, height, mines
+        with self.lock:
+            missing = self.cache_size - len(self.boards.get(config, ())) - self.pending.get(config, 0)
+            if missing <= 0:
+                return
+            self.pending[config] = self.pending.get(config, 0) + missing
+            seeds = [self.random.getrandbits(64) for _ in range(missing)]
+        for seed in seeds:
+            self.pool.apply_async(search, ((width, height, mines, seed, None, self.attempts),),
+                                  callback=partial(self.__collect, config),
+                                  error_callback=partial(self.__collect, config, None))
+
+    def __collect(self, config, board, error=None):
+        # A search gave up or failed when board is None, the next fill starts it again.
+        with self.lock:
+            self.pending[config] -= 1
+            if board is not None:
+                self.boards.setdefault(config, []).append(board)
+
+    def cached(self, width, height, mines):
+        with self.lock:
+            return len(self.boards.get((width, height, mines), ()))
+
+    def take(self, width, height, mines, index):
+        """ Removes and returns a cached board whose opening holds the square at index, None if there is none. """
+        with self.lock:
+            boards = self.boards.get((width, height, mines), [])
+            for position, board in enumerate(boards):
+                if index in board.opening:
+                    return boards.pop(position)
+        return None
+
+    def generate(self, width, height, mines, position, random, attempts=1000):
+        """ Searches a board solvable from the given first position, seeded by random, on the pool once started,
+        in this process otherwise. Returns the Board, or None if none was found in the given number of attempts. """
+        if self.pool is None:
+            return search((width, height, mines, random.getrandbits(64), position, attempts))
+        processes = self.processes or os.cpu_count() or 1
+        while attempts > 0:
+            # A batch per process, each checking a few candidates, so that the search stops shortly after
+            # a board is found instead of leaving the processes busy with the attempts left.
+            batch = []
+            for _ in range(processes):
+                batch_attempts = min(_BATCH_ATTEMPTS, attempts)
+                if not batch_attempts:
+                    break
+                attempts -= batch_attempts
+                batch.append(self.pool.apply_async(
+                    search, ((width, height, mines, random.getrandbits(64), position, batch_attempts),)))
+            boards = [result.get() for result in batch]
+            for board in boards:
+                if board is not None:
+                    return board
+        return None
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+
+class NoGuessMineSweeper(MineSweeper):
+    """ A MineSweeper whose boards can be solved from the first uncovered square without guessing.
+    The board is taken from the cache of the generator when one fits the first square, searched then otherwise,
+    on the processes of the generator if it has any,
+    and if no board is found in attempts candidates a random board is played instead.
+    Boards of the cache don't derive from the seed, seed is None in the games using one. """
+
+    def __init__(self, field_width, field_height, field_mines, seed=None, generator=None, attempts=1000):
+        self.generator = generator if generator is not None else BoardGenerator(processes=0)
+        self.attempts = attempts
+        super().__init__(field_width, field_height, field_mines, seed=seed)
+
+    def __reset__(self):
+        super().__reset__()
+        self.generator.fill(self.field_width, self.field_height, self.field_mines)
+
+    def __place_mines__(self, init_position):
+        config = self.field_width, self.field_height, self.field_mines
+        board = self.generator.take(*config, self.field.index(init_position))
+        if board is not None:
+            self.seed = None
+        else:
+            board = self.generator.generate(*config, init_position, self.random, self.attempts)
+        if board is None:
+            super().__place_mines__(init_position)
+            return
+        self.field.load(board.mines, board.counts)
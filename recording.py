@@ -0,0 +1,264 @@
+""" Binary snapshots of a game and append-only binary logs of the moves of a session.
+    A snapshot packs the flags and the neighbouring mines of every square in half a byte each, along with the seed,
+    the state and the elapsed time of the game, and a checksum of it all.
+    A move log is a header followed by fixed size records, so it is read through a memory map and any record is found
+    without parsing the ones before it. Every game of the log starts with a RESET record holding the seed of the game,
+    so the moves are replayed on the same mines, and ends with a CHECKSUM record of the final state once over. """
+import mmap
+import os
+import struct
+from time import time
+from zlib import crc32
+
+from minesweeper import MineSweeper, INIT, PROGRESS, WINNER, GAME_OVER
+from minesweeper import MINE_FLAG, UNCOVERED_FLAG
+
+# The game states, stored as their index.
+STATES = (INIT, PROGRESS, WINNER, GAME_OVER)
+
+SNAPSHOT_MAGIC = b'MSSN'
+SNAPSHOT_VERSION = 1
+# Magic, version, state, whether seeded, width, height, mines, elapsed seconds, seed.
+_SNAPSHOT_HEADER = struct.Struct('<4sBBBxIIIdQ')
+_CHECKSUM = struct.Struct('<I')
+
+# Tables shifting a byte into the high nibble, and taking the low and the high nibble of a byte.
+_TO_HIGH_NIBBLE = bytes((value << 4) & 0xFF for value in range(256))
+_LOW_NIBBLE = bytes(value & 0x0F for value in range(256))
+_HIGH_NIBBLE = bytes(value >> 4 for value in range(256))
+# Table keeping only the mine flag.
+_MINE_TABLE = bytes(flags & MINE_FLAG for flags in range(256))
+# Table mapping the flags of a square to 1 if it is uncovered without a mine.
+_UNCOVERED_TABLE = bytes(1 if flags & UNCOVERED_FLAG and not flags & MINE_FLAG else 0 for flags in range(256))
+
+LOG_MAGIC = b'MSLG'
+LOG_VERSION = 1
+# Magic, version, width, height, mines.
+_LOG_HEADER = struct.Struct('<4sBxxxIII')
+# Kind, source, x, y.
+_RECORD = struct.Struct('<BBII')
+
+# Kinds of the records of a move log.
+UNCOVER_MOVE = 1
+TOGGLE_MOVE = 2
+MARK_MOVE = 3
+UNCOVER_NEIGHBOURS_MOVE = 4
+# A new game, x and y are the low and high 32 bits of its seed.
+RESET_RECORD = 5
+# The end of a game, x is the checksum of its state and y the index of its state.
+CHECKSUM_RECORD = 6
+
+# Sources of the moves.
+PLAYER = 0
+SOLVER = 1
+
+
+def pack_nibbles(values):
+    # Packs a byte per value, all below 16, into half a byte per value, the first of every two in the low nibble.
+    # The halves are put together with a single bitwise or of two big integers instead of a loop per byte.
+    low = bytes(values[0::2])
+    high = bytes(values[1::2]).translate(_TO_HIGH_NIBBLE).ljust(len(low), b'\0')
+    return (int.from_bytes(low, 'little') | int.from_bytes(high, 'little')).to_bytes(len(low), 'little')
+
+
+def unpack_nibbles(packed, length):
+    # Reverses pack_nibbles, returns a bytearray of length values.
+    values = bytearray(length)
+    values[0::2] = packed.translate(_LOW_NIBBLE)[:(length + 1) // 2]
+    values[1::2] = packed.translate(_HIGH_NIBBLE)[:length // 2]
+    return values
+
+
+def state_checksum(minesweeper):
+    """ Returns a checksum of the flags of all squares and the state of the game. """
+    return crc32(minesweeper.field.flags, STATES.index(minesweeper.game_state))
+
+
+def elapsed_time(minesweeper):
+    if minesweeper.game_state == PROGRESS:
+        return time() - minesweeper.start_time
+    return float(minesweeper.game_duration)
+
+
+def snapshot(minesweeper):
+    """ Returns the snapshot of the game, as bytes. """
+    field = minesweeper.field
+    seed = minesweeper.seed
+    seeded = isinstance(seed, int) and 0 <= seed < 2 ** 64
+    data = _SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, STATES.index(minesweeper.game_state), seeded,
+                                 minesweeper.field_width, minesweeper.field_height, minesweeper.field_mines,
+                                 elapsed_time(minesweeper), seed if seeded else 0)
+    data += pack_nibbles(field.flags) + pack_nibbles(field.counts)
+    return data + _CHECKSUM.pack(crc32(data))
+
+
+def restore(data):
+    """ Returns a MineSweeper in the state of the given snapshot.
+    Raises ValueError if the data is not a snapshot or is corrupted. """
+    data = memoryview(data)
+    if len(data) < _SNAPSHOT_HEADER.size + _CHECKSUM.size:
+        raise ValueError('truncated snapshot')
+    magic, version, state, seeded, width, height, mines, elapsed, seed = _SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError('not a snapshot of a supported version')
+    squares = width * height
+    packed_size = (squares + 1) // 2
+    if len(data) != _SNAPSHOT_HEADER.size + 2 * packed_size + _CHECKSUM.size:
+        raise ValueError('truncated snapshot')
+    if crc32(data[:-_CHECKSUM.size]) != _CHECKSUM.unpack_from(data, len(data) - _CHECKSUM.size)[0]:
+        raise ValueError('snapshot checksum mismatch')
+
+    minesweeper = MineSweeper(width, height, mines, seed=seed if seeded else None)
+    if STATES[state] == INIT:
+        return minesweeper
+    offset = _SNAPSHOT_HEADER.size
+    flags = unpack_nibbles(bytes(data[offset:offset + packed_size]), squares)
+    counts = unpack_nibbles(bytes(data[offset + packed_size:offset + 2 * packed_size]), squares)
+    minesweeper.load_mines(flags.translate(_MINE_TABLE), counts)
+    minesweeper.field.load(flags, counts)
+    minesweeper.uncovered = squares - flags.translate(_UNCOVERED_TABLE).count(0)
+    minesweeper.seed = seed if seeded else None
+    minesweeper.start_time = time() - elapsed
+    minesweeper.game_duration = elapsed
+    minesweeper.game_state = STATES[state]
+    return minesweeper
+
+
+def save_snapshot(path, minesweeper):
+    with open(path, 'wb') as file:
+        file.write(snapshot(minesweeper))
+
+
+def load_snapshot(path):
+    with open(path, 'rb') as file:
+        return restore(file.read())
+
+
+class MoveLog:
+    """ Appends the moves of a session of games of the given configuration to the log at path.
+    An existing log of the same configuration is appended to, a record cut short by a crash is dropped. """
+
+    def __init__(self, path, field_width, field_height, field_mines):
+        header = _LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION, field_width, field_height, field_mines)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size:
+            with open(path, 'rb') as file:
+                if file.read(_LOG_HEADER.size) != header:
+                    raise ValueError(f'{path} is not a move log of a {field_width}x{field_height} field '
+                                     f'with {field_mines} mines')
+            records = (size - _LOG_HEADER.size) // _RECORD.size
+            os.truncate(path, _LOG_HEADER.size + records * _RECORD.size)
+        self.file = open(path, 'ab')
+        if not size:
+            self.file.write(header)
+        # Moves are only recorded in games started with reset, whose mines are known from the seed.
+        self.recording = False
+
+    def append(self, kind, x=0, y=0, source=PLAYER):
+        self.file.write(_RECORD.pack(kind, source, x, y))
+
+    def reset(self, seed):
+        # Records the start of a game, seed has to fit in 64 bits.
+        self.append(RESET_RECORD, seed & 0xFFFFFFFF, seed >> 32)
+        self.recording = True
+
+    def record(self, minesweeper, kind, position, source=PLAYER):
+        """ Records the move of the given kind just made on the minesweeper at position,
+        and the checksum of the final state if it ended the game. """
+        if not self.recording:
+            return
+        self.append(kind, position[0], position[1], source)
+        if minesweeper.game_over():
+            self.append(CHECKSUM_RECORD, state_checksum(minesweeper), STATES.index(minesweeper.game_state))
+            self.recording = False
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class MoveLogReader:
+    """ Memory maps the move log at path, a sequence of (kind, source, x, y) records. """
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < _LOG_HEADER.size:
+            self.map.close()
+            raise ValueError(f'{path} is not a move log')
+        magic, version, self.field_width, self.field_height, self.field_mines = _LOG_HEADER.unpack_from(self.map)
+        if magic != LOG_MAGIC or version != LOG_VERSION:
+            self.map.close()
+            raise ValueError(f'{path} is not a move log of a supported version')
+
+    def __len__(self):
+        return (len(self.map) - _LOG_HEADER.size) // _RECORD.size
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return _RECORD.unpack_from(self.map, _LOG_HEADER.size + index * _RECORD.size)
+
+    def records(self, start=0, stop=None):
+        # Iterates over the records from start up to stop (excluded), unpacked straight from the map.
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start >= stop:
+            return iter(())
+        return _RECORD.iter_unpack(self.map[_LOG_HEADER.size + start * _RECORD.size:
+                                            _LOG_HEADER.size + stop * _RECORD.size])
+
+    def kinds(self):
+        # Returns the kind of every record, a byte each, sliced out of the map with a stride of a record.
+        with memoryview(self.map) as view:
+            return bytes(view[_LOG_HEADER.size:_LOG_HEADER.size + len(self) * _RECORD.size:_RECORD.size])
+
+    def game_start(self, index):
+        """ Returns the index of the RESET record of the game holding the record at index, or -1 if none. """
+        return self.kinds().rfind(RESET_RECORD, 0, index + 1)
+
+    def close(self):
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _apply(minesweeper, kind, x, y):
+    if kind == UNCOVER_MOVE:
+        minesweeper.uncover((x, y))
+    elif kind == TOGGLE_MOVE:
+        minesweeper.toggle((x, y))
+    elif kind == MARK_MOVE:
+        minesweeper.toggle((x, y), force_mark=True)
+    elif kind == UNCOVER_NEIGHBOURS_MOVE:
+        minesweeper.uncover_neighbours((x, y))
+
+
+def replay(log, start=0, stop=None, verify=True):
+    """ Replays the records of the log from start up to stop (excluded, the end of the log by default) on a
+    MineSweeper without any listener, and returns it. The replay starts from the RESET record of the game holding
+    the record at start, so the state is exact whichever record is sought.
+    With verify, raises ValueError when the state at a CHECKSUM record differs from the recorded one. """
+    first = log.game_start(start)
+    if first < 0:
+        raise ValueError(f'no game starts at or before record {start}')
+    minesweeper = MineSweeper(log.field_width, log.field_height, log.field_mines)
+    for index, (kind, _, x, y) in enumerate(log.records(first, stop), first):
+        if kind == RESET_RECORD:
+            minesweeper.reset(seed=x | y << 32)
+        elif kind == CHECKSUM_RECORD:
+            if verify and (x, y) != (state_checksum(minesweeper), STATES.index(minesweeper.game_state)):
+                raise ValueError(f'record {index}: the replayed state differs from the recorded one')
+        else:
+            _apply(minesweeper, kind, x, y)
+    return minesweeper
@@ -0,0 +1,237 @@
+""" An asyncio server hosting many MineSweeper sessions, for bots and remote players.
+    The protocol is one JSON object per line over TCP, each request answered by one line in the order received:
+        {"id": 1, "op": "create", "width": 30, "height": 16, "mines": 99, "seed": 7}
+            -> {"id": 1, "session": 1, "state": "INIT", "width": 30, "height": 16, "mines": 99}
+        {"id": 2, "op": "uncover", "session": 1, "x": 3, "y": 4}
+            -> {"id": 2, "state": "PROGRESS", "pending_mines": 99, "changed": [[3, 4, 0], [3, 5, 1], ...]}
+    uncover_neighbours takes x and y as well, toggle also takes "force" to mark the square whatever its state.
+    "moves" plays a batch of moves at once, given as "moves": [[x, y, "UNCOVER" or "MARK"], ...], up to game over.
+    Only the squares which changed are sent, as [x, y, cell] where cell is the number of neighbouring mines
+    of an uncovered square, or one of the codes below. Once the game is over, "mines" lists all the mines.
+    "hint" answers the next move of the advanced solver as "move": [x, y, "UNCOVER" or "MARK"], null when it has none,
+    and as "moves" along with the others it already deduced, to send back all at once with "moves".
+    "close" ends the session. Sizes, seeds and coordinates are JSON integers, anything else is an error.
+    Errors are answered as {"id": ..., "error": "message"}.
+    Sessions idle for longer than the idle timeout are evicted. Run this module with --help for its options. """
+import asyncio
+import json
+from argparse import ArgumentParser
+from functools import partial
+from time import monotonic
+
+from minesweeper import MineSweeper, MINE_FLAG, UNCOVERED_FLAG, MARKED_FLAG, UNCERTAIN_FLAG
+from utilities import solver
+
+# Codes of the squares which don't show a number.
+MINE_CELL = 9
+MARKED_CELL = 10
+UNCERTAIN_CELL = 11
+COVERED_CELL = 12
+# Largest field a session can be created with, so that no single move holds up the other sessions for long.
+MAX_SQUARES = 256 * 256
+# Most moves of a batch.
+MAX_MOVES = 10000
+
+
+def integer(value, name):
+    # Returns the value of the given field of a request, which must be a JSON integer: numbers with a fraction or an
+    # exponent are parsed as floats, and rejected rather than truncated, as are booleans.
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f'{name} must be an integer')
+    return value
+
+
+def cell(field, index):
+    # Returns what the player sees of the square at index.
+    flags = field.flags[index]
+    if flags & UNCOVERED_FLAG:
+        return MINE_CELL if flags & MINE_FLAG else field.counts[index]
+    if flags & MARKED_FLAG:
+        return MARKED_CELL
+    if flags & UNCERTAIN_FLAG:
+        return UNCERTAIN_CELL
+    return COVERED_CELL
+
+
+class Session:
+    """ A game hosted by the server. Requests on the same session are applied one at a time under its lock. """
+
+    def __init__(self, minesweeper):
+        self.minesweeper = minesweeper
+        self.lock = asyncio.Lock()
+        # The solver is only created once a hint is asked for.
+        self.steps = None
+        self.last_used = monotonic()
+
+    def changes(self, positions):
+        # Returns the response to a move which changed the given positions.
+        minesweeper = self.minesweeper
+        field = minesweeper.field
+        response = {'state': minesweeper.game_state, 'pending_mines': minesweeper.pending_mines(),
+                    'changed': [[x, y, cell(field, field.index((x, y)))] for x, y in positions]}
+        if minesweeper.game_over():
+            response['mines'] = [list(field.position(index)) for index, flags in enumerate(field.flags)
+                                 if flags & MINE_FLAG]
+        return response
+
+    def hint(self):
+        if self.steps is None:
+            self.steps = solver(self.minesweeper, advanced=True)
+        try:
+            move = next(self.steps)
+        except StopIteration:
+            return {'move': None, 'moves': []}
+        moves = [[x, y, operation] for (x, y), operation in [move] + self.steps.deductions()]
+        return {'move': moves[0], 'moves': moves}
+
+
+class GameServer:
+    """ Hosts the sessions and answers the requests of all connections. """
+
+    def __init__(self, idle_timeout=300.0, max_sessions=100000):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self.next_session = 1
+        self.requests = 0
+
+    async def create(self, request):
+        width, height, mines = (integer(request[name], name) for name in ('width', 'height', 'mines'))
+        if not (0 < width and 0 < height and 9 <= width * height <= MAX_SQUARES):
+            raise ValueError(f'fields of 9 to {MAX_SQUARES} squares are supported')
+        if len(self.sessions) >= self.max_sessions:
+            self.evict(monotonic())
+            if len(self.sessions) >= self.max_sessions:
+                raise ValueError('too many sessions')
+        seed = request.get('seed')
+        if seed is not None:
+            seed = integer(seed, 'seed')
+        # Building the field of a new size computes its neighbour table, which is done on a thread.
+        minesweeper = await asyncio.get_running_loop().run_in_executor(
+            None, partial(MineSweeper, width, height, mines, seed=seed))
+        session_id = self.next_session
+        self.next_session += 1
+        self.sessions[session_id] = Session(minesweeper)
+        return {'session': session_id, 'state': minesweeper.game_state, 'width': width, 'height': height,
+                'mines': minesweeper.field_mines}
+
+    def session(self, request):
+        session = self.sessions.get(request.get('session'))
+        if session is None:
+            raise ValueError('no such session')
+        session.last_used = monotonic()
+        return session
+
+    async def handle(self, request):
+        """ Returns the response to the given request, a dict. """
+        self.requests += 1
+        response = {'id': request.get('id')}
+        try:
+            op = request.get('op')
+            if op == 'create':
+                response.update(await self.create(request))
+            elif op in ('uncover', 'toggle', 'uncover_neighbours', 'moves', 'hint'):
+                session = self.session(request)
+                async with session.lock:
+                    minesweeper = session.minesweeper
+                    if op == 'hint':
+                        # The solver may take a while on large fields, it runs on a thread so other sessions
+                        # are served meanwhile, while this one waits under its lock.
+                        response.update(await asyncio.get_running_loop().run_in_executor(None, session.hint))
+                    elif op == 'moves':
+                        moves = request['moves']
+                        if not isinstance(moves, list) or len(moves) > MAX_MOVES:
+                            raise ValueError(f'moves must be a list of at most {MAX_MOVES} moves')
+                        if not all(isinstance(move, list) and len(move) == 3 for move in moves):
+                            raise ValueError('moves must be given as [x, y, operation]')
+                        # apply_moves checks all the moves before playing any.
+                        changed, _ = minesweeper.apply_moves(((integer(x, 'x'), integer(y, 'y')), operation)
+                                                             for x, y, operation in moves)
+                        response.update(session.changes(changed))
+                    else:
+                        position = integer(request['x'], 'x'), integer(request['y'], 'y')
+                        if position not in minesweeper.field:
+                            raise ValueError('position out of the field')
+                        if op == 'uncover':
+                            changed = minesweeper.uncover(position)
+                        elif op == 'toggle':
+                            changed = minesweeper.toggle(position, force_mark=bool(request.get('force')))
+                        else:
+                            changed = minesweeper.uncover_neighbours(position)
+                        response.update(session.changes(changed))
+            elif op == 'close':
+                self.session(request)
+                del self.sessions[request['session']]
+            else:
+                raise ValueError(f'unknown op {op!r}')
+        except KeyError as error:
+            response['error'] = f'missing {error.args[0]}'
+        except (ValueError, TypeError) as error:
+            response['error'] = str(error)
+        return response
+
+    async def connection(self, reader, writer):
+        # Answers the requests of a connection, a line each, until it closes.
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError
+                except ValueError:
+                    response = {'id': None, 'error': 'malformed request'}
+                else:
+                    response = await self.handle(request)
+                writer.write(json.dumps(response, separators=(',', ':')).encode() + b'\n')
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            # Lost connection, or a line longer than the limit of the reader.
+            pass
+        finally:
+            writer.close()
+
+    def evict(self, now):
+        # Drops the sessions idle for longer than the idle timeout.
+        idle = [session_id for session_id, session in self.sessions.items()
+                if now - session.last_used > self.idle_timeout and not session.lock.locked()]
+        for session_id in idle:
+            del self.sessions[session_id]
+        return len(idle)
+
+    async def evict_idle(self):
+        while True:
+            await asyncio.sleep(max(1.0, self.idle_timeout / 4))
+            self.evict(monotonic())
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        server = await asyncio.start_server(self.connection, host, port, limit=2 ** 20)
+        eviction = asyncio.create_task(self.evict_idle())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            eviction.cancel()
+
+
+def main():
+    parser = ArgumentParser(description='Serves minesweeper sessions over TCP, a JSON request per line.')
+    parser.add_argument('--host', default='127.0.0.1', help='the address to listen on.')
+    parser.add_argument('--port', type=int, default=8765, help='the port to listen on.')
+    parser.add_argument('--idle_timeout', type=float, default=300.0,
+                        help='seconds after which an idle session is evicted.')
+    parser.add_argument('--max_sessions', type=int, default=100000, help='the number of sessions hosted at most.')
+    args = parser.parse_args()
+
+    game_server = GameServer(idle_timeout=args.idle_timeout, max_sessions=args.max_sessions)
+    print(f'Serving on {args.host}:{args.port}', flush=True)
+    try:
+        asyncio.run(game_server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
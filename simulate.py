@@ -0,0 +1,135 @@
+""" Headless batch runner, playing seeded games of the solver against the minesweeper across a pool of processes.
+    Use simulate from python or run this module from the command line, pass --help for the options it supports. """
+from argparse import ArgumentParser
+from multiprocessing import Pool
+from random import Random
+from time import time
+
+from minesweeper import MineSweeper, WINNER, UNCOVERED_FLAG, MARKED_FLAG
+from noguess import NoGuessMineSweeper
+from utilities import solver, MARK, UNCOVER
+
+
+class Results:
+    """ Aggregate results of a number of games. """
+
+    def __init__(self, games=0, wins=0, moves=0, guesses=0, elapsed=0.0):
+        self.games = games
+        self.wins = wins
+        self.moves = moves
+        self.guesses = guesses
+        # Wall clock seconds since the simulation started.
+        self.elapsed = elapsed
+
+    def merge(self, other):
+        self.games += other.games
+        self.wins += other.wins
+        self.moves += other.moves
+        self.guesses += other.guesses
+
+    @property
+    def win_rate(self):
+        return self.wins / self.games if self.games else 0.0
+
+    @property
+    def games_per_second(self):
+        return self.games / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        games = max(1, self.games)
+        return f'RESULTS{{games: {self.games}, win rate: {self.win_rate:.4f}, moves/game: {self.moves / games:.1f}, ' \
+               f'guesses/game: {self.guesses / games:.2f}, games/sec: {self.games_per_second:.1f} }}'
+
+
+def play(minesweeper, steps, random):
+    # Plays the current game of the minesweeper to the end with the given solver.
+    # When the solver gets stuck, a random covered square is uncovered.
+    # Returns (whether the game was won, number of moves, number of guesses).
+    moves = guesses = 0
+    while not minesweeper.game_over():
+        try:
+            position, operation = next(steps)
+            if getattr(steps, 'guessed', False):
+                guesses += 1
+        except StopIteration:
+            field = minesweeper.field
+            covered = [index for index, flags in enumerate(field.flags) if not flags & (UNCOVERED_FLAG | MARKED_FLAG)]
+            position, operation = field.position(random.choice(covered)), UNCOVER
+            guesses += 1
+        if operation == MARK:
+            minesweeper.toggle(position, force_mark=True)
+        elif operation == UNCOVER:
+            minesweeper.uncover(position)
+        moves += 1
+    return minesweeper.game_state == WINNER, moves, guesses
+
+
+# The game and solver of each worker process, reused across games with the same configuration.
+_worker_game = {}
+
+
+def _play_games(task):
+    # Plays the games numbered first to last (excluded) of the given configuration, in a worker process.
+    width, height, mines, advanced, no_guess, seed, first, last = task
+    key = width, height, mines, advanced, no_guess
+    if key not in _worker_game:
+        _worker_game.clear()
+        # Boards without guessing are searched in the worker, from the first square of each game.
+        minesweeper = NoGuessMineSweeper(width, height, mines) if no_guess else MineSweeper(width, height, mines)
+        _worker_game[key] = minesweeper, solver(minesweeper, advanced=advanced)
+    minesweeper, steps = _worker_game[key]
+    results = Results()
+    for game in range(first, last):
+        # Every game is seeded by its number, so results don't depend on which worker played it.
+        game_seed = seed * 1_000_003 + game
+        minesweeper.reset(seed=game_seed)
+        won, moves, guesses = play(minesweeper, steps, Random(game_seed))
+        results.merge(Results(games=1, wins=won, moves=moves, guesses=guesses))
+    return results
+
+
+def simulate(width, height, mines, games, seed=0, processes=None, chunk_size=500, advanced=True, no_guess=False):
+    """ Plays the given number of games of the given configuration over a pool of processes.
+    Yields the aggregate Results so far, each time a chunk of games completes.
+    processes defaults to the number of cores, pass 0 to play in this process.
+    With no_guess, only boards which can be solved without guessing are played. """
+    tasks = [(width, height, mines, advanced, no_guess, seed, first, min(games, first + chunk_size))
+             for first in range(0, games, chunk_size)]
+    results = Results()
+    start = time()
+
+    def collect(chunks):
+        for chunk in chunks:
+            results.merge(chunk)
+            results.elapsed = time() - start
+            yield results
+
+    if processes == 0:
+        yield from collect(map(_play_games, tasks))
+    else:
+        with Pool(processes) as pool:
+            yield from collect(pool.imap_unordered(_play_games, tasks))
+
+
+def main():
+    parser = ArgumentParser(description='Plays minesweeper games with the solver, without any window.')
+    parser.add_argument('--field_width', type=int, default=30, help='the number of columns in the field.')
+    parser.add_argument('--field_height', type=int, default=16, help='the number of rows in the field.')
+    parser.add_argument('--field_mines', type=int, default=99, help='the number of mines in the field.')
+    parser.add_argument('--games', type=int, default=10000, help='the number of games to play.')
+    parser.add_argument('--seed', type=int, default=0, help='the seed of the games, same seed plays same games.')
+    parser.add_argument('--processes', type=int, default=None, help='the number of worker processes.')
+    parser.add_argument('--chunk_size', type=int, default=500, help='the number of games per task of a worker.')
+    parser.add_argument('--basic_solver', action='store_true', help='use the basic solver, guessing randomly.')
+    parser.add_argument('--no_guess', action='store_true',
+                        help='only play boards which can be solved without guessing.')
+    args = parser.parse_args()
+
+    for results in simulate(args.field_width, args.field_height, args.field_mines, args.games, seed=args.seed,
+                            processes=args.processes, chunk_size=args.chunk_size, advanced=not args.basic_solver,
+                            no_guess=args.no_guess):
+        print(results, flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+from random import Random
+from time import monotonic, sleep
+
+import pytest
+
+from autoplay import SolverWorker, _VISIBLE_TABLE
+from chunked import ChunkedMineSweeper
+from minesweeper import MineSweeper, PROGRESS, WINNER, GAME_OVER, MINE_FLAG, UNCOVERED_FLAG, MARK
+
+
+def whole(seed):
+    return MineSweeper(16, 16, 40, seed=seed), False
+
+
+def chunked(seed):
+    # Small chunks, few of them kept, so that chunks are evicted and resolved ones compressed while playing.
+    return ChunkedMineSweeper(40, 30, 180, seed=seed, chunk_size=8, max_chunks=4), True
+
+
+def wait(worker):
+    # Waits until the worker has a move ready, or nothing left to compute.
+    deadline = monotonic() + 10
+    while monotonic() < deadline:
+        with worker.condition:
+            if worker.moves or (worker.stalled and not worker.changes):
+                return
+        sleep(0.001)
+    raise AssertionError('the worker never stopped')
+
+
+def wait_stalled(worker):
+    # Waits until the worker computed all the moves it can.
+    deadline = monotonic() + 10
+    while monotonic() < deadline:
+        with worker.condition:
+            if worker.stalled and not worker.changes:
+                return
+        sleep(0.001)
+    raise AssertionError('the worker never stopped')
+
+
+def play(minesweeper, move):
+    position, operation = move
+    if operation == MARK:
+        # The worker only marks mines, guesses are uncovers.
+        assert minesweeper[position].mine, move
+        return minesweeper.toggle(position, force_mark=True)
+    return minesweeper.uncover(position)
+
+
+def queued(minesweeper, worker):
+    # The moves queued by the worker, but for those on squares uncovered since, which take skips.
+    field = minesweeper.field
+    with worker.condition:
+        return {(position, operation) for position, operation in worker.moves
+                if not field.flags[field.index(position)] & UNCOVERED_FLAG}
+
+
+def assert_in_sync(minesweeper, worker):
+    # Once the worker is stalled, the shadow shows what the player sees, but for the marks played ahead.
+    wait_stalled(worker)
+    assert worker.shadow.game_state == minesweeper.game_state
+    if minesweeper.game_state != PROGRESS:
+        # The solver has nothing to do, the shadow of a chunked field is left empty then.
+        return
+    field, shadow = minesweeper.field, worker.shadow.field
+    for index in set(field.played()) | set(shadow.played()):
+        expected = bytes([field.flags[index]]).translate(_VISIBLE_TABLE)[0]
+        assert worker.ahead.get(index, shadow.flags[index]) == expected, field.position(index)
+        if expected & UNCOVERED_FLAG:
+            assert shadow.counts[index] == field.counts[index]
+
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('game', [whole, chunked])
+def test_plays_games(game, seed):
+    minesweeper, sparse = game(seed)
+    worker = SolverWorker(minesweeper, advanced=True, sparse=sparse)
+    try:
+        while minesweeper.game_state not in (WINNER, GAME_OVER):
+            wait(worker)
+            move = worker.take()
+            if move is None:
+                assert worker.busy(), 'the solver always has a move, a guess at worst'
+                continue
+            play(minesweeper, move)
+        assert_in_sync(minesweeper, worker)
+        # A new game starts over from the whole board.
+        minesweeper.reset()
+        wait(worker)
+        assert worker.take()[1] != MARK
+    finally:
+        worker.close()
+
+
+@pytest.mark.parametrize('game', [whole, chunked])
+def test_stops_once_all_its_moves_are_queued(game):
+    # Uncovers can't be played on the shadow, the solver would return them again and again.
+    minesweeper, sparse = game(3)
+    worker = SolverWorker(minesweeper, sparse=sparse)
+    try:
+        minesweeper.uncover((minesweeper.field_width // 2, minesweeper.field_height // 2))
+        wait_stalled(worker)
+        moves = queued(minesweeper, worker)
+        assert moves
+        assert len({position for position, _ in moves}) == len(moves)
+        field = worker.shadow.field
+        assert worker.pending == {field.index(position) for position, operation in moves if operation != MARK}
+        assert set(worker.ahead) == {field.index(position) for position, operation in moves if operation == MARK}
+    finally:
+        worker.close()
+
+
+@pytest.mark.parametrize('game', [whole, chunked])
+def test_cancel_drops_the_moves_and_the_marks_ahead(game):
+    minesweeper, sparse = game(3)
+    worker = SolverWorker(minesweeper, sparse=sparse)
+    try:
+        minesweeper.uncover((minesweeper.field_width // 2, minesweeper.field_height // 2))
+        wait_stalled(worker)
+        moves = queued(minesweeper, worker)
+        assert any(operation == MARK for _, operation in moves)
+        generation = worker.generation
+        worker.cancel()
+        with worker.condition:
+            assert worker.generation == generation + 1
+            assert not worker.moves
+        # Nothing changed, the same moves follow again.
+        wait_stalled(worker)
+        assert queued(minesweeper, worker) == moves
+        assert_in_sync(minesweeper, worker)
+    finally:
+        worker.close()
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('game', [whole, chunked])
+def test_follows_the_player(game, seed):
+    # The player plays moves of their own between those of the worker, wrong marks included, and every move of the
+    # player cancels the worker, as the game does.
+    random = Random(seed)
+    minesweeper, sparse = game(seed)
+    worker = SolverWorker(minesweeper, advanced=True, sparse=sparse)
+    try:
+        minesweeper.uncover((minesweeper.field_width // 2, minesweeper.field_height // 2))
+        for _ in range(300):
+            if minesweeper.game_state != PROGRESS:
+                break
+            if random.random() < 0.2:
+                field = minesweeper.field
+                covered = [index for index in field.played() if not field.flags[index] & UNCOVERED_FLAG]
+                frontier = {neighbour for index in field.played() if field.flags[index] & UNCOVERED_FLAG
+                            for neighbour in field.neighbours[index] if not field.flags[neighbour] & UNCOVERED_FLAG}
+                choices = sorted(frontier | set(covered))
+                if choices:
+                    position = field.position(random.choice(choices))
+                    if random.random() < 0.8 or field.flags[field.index(position)] & MINE_FLAG:
+                        minesweeper.toggle(position)
+                    else:
+                        minesweeper.uncover(position)
+                    worker.cancel()
+                    assert_in_sync(minesweeper, worker)
+                    continue
+            wait(worker)
+            move = worker.take()
+            if move is not None:
+                position, operation = move
+                if operation == MARK:
+                    minesweeper.toggle(position, force_mark=True)
+                else:
+                    minesweeper.uncover(position)
+        assert_in_sync(minesweeper, worker)
+    finally:
+        worker.close()
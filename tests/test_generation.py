@@ -0,0 +1,61 @@
+import pytest
+
+from minesweeper import MineSweeper
+
+np = pytest.importorskip('numpy')
+
+from generation import safe_zones, place_mines, count_neighbouring_mines, generate_boards, hydrate
+
+
+@pytest.mark.parametrize('init_position', [(0, 0), (4, 3), (8, 6), (8, 0)])
+def test_place_mines(init_position):
+    mines = place_mines(50, 9, 7, 20, init_position, rng=1)
+    assert mines.shape == (50, 9, 7)
+    assert (mines.sum(axis=(1, 2)) == 20).all()
+    # The initial position and its neighbours are free of mines on every board.
+    x, y = init_position
+    assert not mines[:, max(0, x - 1):x + 2, max(0, y - 1):y + 2].any()
+
+
+def test_place_mines_per_board_positions():
+    positions = [(0, 0), (4, 3), (8, 6)]
+    mines = place_mines(3, 9, 7, 20, positions, rng=2)
+    safe = safe_zones(9, 7, positions)
+    assert safe.sum(axis=(1, 2)).tolist() == [4, 9, 4]
+    assert not (mines & safe).any()
+
+
+def test_place_mines_caps_the_number_of_mines():
+    # Only the squares out of the safe zone can get a mine.
+    mines = place_mines(4, 5, 5, 100, (2, 2), rng=3)
+    assert (mines.sum(axis=(1, 2)) == 25 - 9).all()
+    assert not place_mines(4, 5, 5, -1, (2, 2), rng=3).any()
+
+
+def test_counts_match_load_mines():
+    mines, neighbouring_mines = generate_boards(10, 11, 6, 15, (5, 3), rng=4)
+    assert neighbouring_mines.dtype == np.uint8
+    for board, counts in zip(mines, neighbouring_mines):
+        minesweeper = MineSweeper(11, 6, 15)
+        minesweeper.load_mines(bytes(board.astype(np.uint8)))
+        assert bytes(minesweeper.field.counts) == counts.tobytes()
+
+
+def test_counts_of_a_full_board():
+    counts = count_neighbouring_mines(np.ones((1, 3, 4), dtype=bool))[0]
+    assert counts.tolist() == [[3, 5, 5, 3], [5, 8, 8, 5], [3, 5, 5, 3]]
+
+
+@pytest.mark.parametrize('with_counts', [False, True])
+def test_hydrate(with_counts):
+    mines, neighbouring_mines = generate_boards(1, 11, 6, 15, (5, 3), rng=5)
+    minesweeper = MineSweeper(11, 6, 15)
+    hydrate(minesweeper, mines[0], neighbouring_mines[0] if with_counts else None)
+    assert minesweeper.field_mines == 15
+    assert {position for position in minesweeper if minesweeper[position].mine} == \
+        {(x, y) for x, y in zip(*np.nonzero(mines[0]))}
+    assert bytes(minesweeper.field.counts) == neighbouring_mines[0].tobytes()
+    # The first uncover keeps the loaded mines.
+    minesweeper.uncover((5, 3))
+    assert minesweeper[5, 3].uncovered
+    assert sum(minesweeper[position].mine for position in minesweeper) == 15
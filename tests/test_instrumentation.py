@@ -0,0 +1,21 @@
+from instrumentation import Instrumentation
+from minesweeper import MineSweeper
+from utilities import solver
+
+
+def test_one_solver_move_recorded_per_move():
+    instrumentation = Instrumentation()
+    instrumentation.enable()
+    try:
+        minesweeper = MineSweeper(16, 16, 40, seed=3)
+        steps = solver(minesweeper, advanced=True)
+        moves = 0
+        while not minesweeper.game_over():
+            minesweeper.apply_moves([next(steps)])
+            moves += 1
+    finally:
+        instrumentation.disable()
+    histograms = instrumentation.histograms
+    assert 'Solver.__next__' not in histograms
+    assert histograms['AdvancedSolver.__next__'].count == moves
+    assert histograms['MineSweeper.apply_moves'].count == moves
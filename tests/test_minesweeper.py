@@ -0,0 +1,135 @@
+from random import Random
+
+import pytest
+
+from chunked import ChunkedMineSweeper
+from minesweeper import MineSweeper, INIT, PROGRESS, WINNER, GAME_OVER, MARK, UNCOVER
+
+
+@pytest.mark.parametrize('moves', [
+    [((4, 4), UNCOVER), ((1.5, 2), UNCOVER)],
+    [((4, 4), UNCOVER), ((9, 0), MARK)],
+    [((4, 4), UNCOVER), ((0, 0), 'TOGGLE')],
+    [((4, 4), UNCOVER), ((0, 0, 0), MARK)],
+])
+def test_apply_moves_rejects_a_bad_batch_untouched(moves):
+    minesweeper = MineSweeper(9, 9, 10, seed=1)
+    calls = []
+    minesweeper.add_listener(calls.append)
+    with pytest.raises(ValueError):
+        minesweeper.apply_moves(moves)
+    assert minesweeper.game_state == INIT
+    assert not any(minesweeper.field.flags)
+    assert not calls
+
+
+def test_apply_moves_notifies_once():
+    minesweeper = MineSweeper(9, 9, 10, seed=1)
+    calls = []
+    minesweeper.add_listener(calls.append)
+    changed, state = minesweeper.apply_moves([((4, 4), UNCOVER), ((4, 4), UNCOVER)])
+    assert state == PROGRESS and minesweeper.game_state == PROGRESS
+    assert calls == [changed] and len(set(changed)) == len(changed)
+
+
+class ReferenceGame:
+    """ The rules of the original implementation, a dict of squares played recursively, to compare against. """
+
+    def __init__(self, width, height, mines):
+        self.width = width
+        self.height = height
+        self.mines = mines
+        self.uncovered, self.marked, self.uncertain = set(), set(), set()
+        self.total_non_mines = width * height - len(mines)
+        self.state = PROGRESS
+
+    def neighbours(self, position):
+        x, y = position
+        return [(nx, ny) for nx, ny in [(x + 1, y - 1), (x + 1, y), (x + 1, y + 1), (x - 1, y - 1), (x - 1, y),
+                                        (x - 1, y + 1), (x, y - 1), (x, y + 1)]
+                if 0 <= nx < self.width and 0 <= ny < self.height]
+
+    def count(self, position):
+        return sum(neighbour in self.mines for neighbour in self.neighbours(position))
+
+    def uncover(self, position):
+        if self.state != PROGRESS or position in self.uncovered | self.marked | self.uncertain:
+            return
+        self.uncovered.add(position)
+        if position in self.mines:
+            self.state = GAME_OVER
+            return
+        if len(self.uncovered) >= self.total_non_mines:
+            self.state = WINNER
+            return
+        if not self.count(position):
+            for neighbour in self.neighbours(position):
+                self.uncover(neighbour)
+
+    def toggle(self, position, force_mark=False):
+        if self.state != PROGRESS or position in self.uncovered:
+            return
+        if force_mark or position not in self.marked | self.uncertain:
+            self.marked.add(position)
+            self.uncertain.discard(position)
+        elif position in self.marked:
+            self.marked.discard(position)
+            self.uncertain.add(position)
+        else:
+            self.uncertain.discard(position)
+
+    def uncover_neighbours(self, position):
+        if self.state != PROGRESS or position not in self.uncovered or not self.count(position):
+            return
+        neighbours = self.neighbours(position)
+        if any(neighbour in self.uncertain for neighbour in neighbours):
+            return
+        if sum(neighbour in self.marked for neighbour in neighbours) == self.count(position):
+            for neighbour in neighbours:
+                if neighbour not in self.marked:
+                    self.uncover(neighbour)
+
+
+def chunked(width, height, mines, seed):
+    # Small chunks, few of them kept, so that chunks are evicted and generated again while playing.
+    return ChunkedMineSweeper(width, height, mines, seed=seed, chunk_size=4, max_chunks=2)
+
+
+@pytest.mark.parametrize('seed', range(40))
+@pytest.mark.parametrize('game', [MineSweeper, chunked])
+def test_same_rules_as_the_original_implementation(game, seed):
+    random = Random(seed)
+    width, height = random.randint(3, 12), random.randint(3, 12)
+    minesweeper = game(width, height, random.randint(1, width * height // 4), seed=seed)
+    first = random.randrange(width), random.randrange(height)
+    minesweeper.uncover(first)
+    mines = {position for position in minesweeper if minesweeper[position].mine}
+    # The first square and its neighbours are always free of mines.
+    assert not mines & {first, *minesweeper.neighbours(first)}
+    reference = ReferenceGame(width, height, mines)
+    reference.uncover(first)
+    for _ in range(200):
+        if reference.state != PROGRESS:
+            break
+        position = random.randrange(width), random.randrange(height)
+        operation = random.choice(['uncover', 'toggle', 'toggle', 'force', 'uncover_neighbours'])
+        if operation == 'force':
+            changed = minesweeper.toggle(position, force_mark=True)
+            reference.toggle(position, force_mark=True)
+        else:
+            changed = getattr(minesweeper, operation)(position)
+            getattr(reference, operation)(position)
+        assert len(set(changed)) == len(changed)
+        assert minesweeper.game_state == reference.state
+        assert {p for p in minesweeper if minesweeper[p].uncovered} == reference.uncovered
+        assert {p for p in minesweeper if minesweeper[p].marked} == reference.marked
+        assert {p for p in minesweeper if minesweeper[p].uncertain} == reference.uncertain
+        assert minesweeper.pending_mines() == len(mines) - len(reference.marked)
+        for position in reference.uncovered - mines:
+            assert minesweeper[position].neighbouring_mines == reference.count(position)
+
+
+def test_chunked_mines_cannot_be_loaded():
+    minesweeper = chunked(8, 8, 10, seed=0)
+    with pytest.raises(TypeError, match='generated from the seed'):
+        minesweeper.load_mines(bytes(64))
@@ -0,0 +1,41 @@
+from random import Random
+
+import pytest
+
+from minesweeper import WINNER, MARK
+from noguess import NoGuessMineSweeper, BoardGenerator
+from utilities import solver
+
+
+def play_without_guessing(minesweeper):
+    steps = solver(minesweeper, advanced=True)
+    while not minesweeper.game_over():
+        position, operation = next(steps)
+        assert not steps.guessed
+        if operation == MARK:
+            minesweeper.toggle(position, force_mark=True)
+        else:
+            minesweeper.uncover(position)
+    assert minesweeper.game_state == WINNER
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_generated_board_won_without_guessing(seed):
+    random = Random(seed)
+    minesweeper = NoGuessMineSweeper(16, 16, 40, seed=seed)
+    minesweeper.uncover((random.randrange(16), random.randrange(16)))
+    play_without_guessing(minesweeper)
+
+
+def test_board_searched_on_the_pool_on_a_cache_miss():
+    # Nothing is cached, every first square is searched on the processes of the generator.
+    generator = BoardGenerator(processes=2, cache_size=0, seed=0)
+    try:
+        minesweeper = NoGuessMineSweeper(9, 9, 10, seed=0, generator=generator)
+        for position in [(0, 0), (4, 4), (8, 2)]:
+            minesweeper.reset()
+            minesweeper.uncover(position)
+            assert generator.pool is not None
+            play_without_guessing(minesweeper)
+    finally:
+        generator.close()
@@ -0,0 +1,107 @@
+import os
+
+import pytest
+
+from minesweeper import MineSweeper, PROGRESS
+from recording import snapshot, restore, state_checksum, pack_nibbles, unpack_nibbles
+from recording import MoveLog, MoveLogReader, replay, UNCOVER_MOVE, TOGGLE_MOVE, MARK_MOVE, RESET_RECORD, SOLVER
+from utilities import solver, MARK
+
+
+def play(minesweeper, steps, moves, log=None):
+    # Plays up to the given number of moves of the solver, recording them to the log if any.
+    for _ in range(moves):
+        if minesweeper.game_over():
+            return
+        try:
+            position, operation = next(steps)
+        except StopIteration:
+            return
+        if operation == MARK:
+            minesweeper.toggle(position, force_mark=True)
+            kind = MARK_MOVE
+        else:
+            minesweeper.uncover(position)
+            kind = UNCOVER_MOVE
+        if log is not None:
+            log.record(minesweeper, kind, position, SOLVER)
+
+
+@pytest.mark.parametrize('length', [0, 1, 2, 7, 8])
+def test_nibbles_round_trip(length):
+    values = bytes(value % 16 for value in range(3, 3 + length))
+    assert unpack_nibbles(pack_nibbles(values), length) == values
+
+
+@pytest.mark.parametrize('moves', [0, 1, 10, 1000])
+def test_snapshot_round_trip(moves):
+    minesweeper = MineSweeper(17, 11, 30, seed=4)
+    play(minesweeper, solver(minesweeper, advanced=True), moves)
+    if minesweeper.game_state == PROGRESS:
+        # Some squares marked and uncertain, wherever they are.
+        covered = [position for position in minesweeper if not minesweeper[position].uncovered]
+        minesweeper.toggle(covered[0])
+        minesweeper.toggle(covered[-1])
+        minesweeper.toggle(covered[-1])
+    restored = restore(snapshot(minesweeper))
+    assert restored.game_state == minesweeper.game_state
+    assert restored.seed == minesweeper.seed
+    assert restored.field.flags == minesweeper.field.flags
+    assert restored.field.counts == minesweeper.field.counts
+    assert restored.field.marked == minesweeper.field.marked
+    assert restored.field.uncertain == minesweeper.field.uncertain
+    assert restored.uncovered == minesweeper.uncovered
+    assert state_checksum(restored) == state_checksum(minesweeper)
+
+
+def test_corrupted_snapshot_rejected():
+    minesweeper = MineSweeper(9, 9, 10, seed=1)
+    minesweeper.uncover((4, 4))
+    data = bytearray(snapshot(minesweeper))
+    with pytest.raises(ValueError):
+        restore(data[:-1])
+    data[40] ^= 1
+    with pytest.raises(ValueError):
+        restore(data)
+
+
+def test_move_log_replay(tmp_path):
+    path = str(tmp_path / 'session.mslg')
+    minesweeper = MineSweeper(16, 16, 40)
+    steps = solver(minesweeper, advanced=True)
+    checksums = []
+    with MoveLog(path, 16, 16, 40) as log:
+        for seed in (1, 2, 3):
+            minesweeper.reset(seed=seed)
+            log.reset(seed)
+            play(minesweeper, steps, 10000, log)
+            # A move which does not change anything, replayed all the same.
+            log.append(TOGGLE_MOVE, 0, 0)
+            checksums.append(state_checksum(minesweeper))
+    with MoveLogReader(path) as reader:
+        assert (reader.field_width, reader.field_height, reader.field_mines) == (16, 16, 40)
+        assert state_checksum(replay(reader)) == checksums[-1]
+        # Seeking into the second game replays it from its start.
+        second = reader.kinds().index(RESET_RECORD, 1)
+        assert reader.game_start(second + 3) == second
+        assert replay(reader, second + 3, second + 4).game_state == PROGRESS
+        assert state_checksum(replay(reader, second + 3, reader.kinds().index(RESET_RECORD, second + 1))) == \
+            checksums[1]
+
+
+def test_move_log_drops_a_partial_record(tmp_path):
+    path = str(tmp_path / 'session.mslg')
+    with MoveLog(path, 9, 9, 10) as log:
+        log.reset(7)
+        log.append(UNCOVER_MOVE, 4, 4)
+    size = os.path.getsize(path)
+    with open(path, 'ab') as file:
+        file.write(b'\1\0\3')
+    with MoveLog(path, 9, 9, 10):
+        pass
+    assert os.path.getsize(path) == size
+    with MoveLogReader(path) as reader:
+        assert len(reader) == 2
+        assert reader[1] == (UNCOVER_MOVE, 0, 4, 4)
+    with pytest.raises(ValueError):
+        MoveLog(path, 9, 9, 11)
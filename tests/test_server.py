@@ -0,0 +1,153 @@
+import asyncio
+import json
+from time import monotonic
+
+import pytest
+
+from minesweeper import INIT, PROGRESS, WINNER, GAME_OVER
+from server import GameServer, MARKED_CELL, COVERED_CELL
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def create(server, **request):
+    response = await server.handle({'id': 0, 'op': 'create', 'width': 9, 'height': 9, 'mines': 10, 'seed': 1,
+                                    **request})
+    assert 'error' not in response, response
+    return response['session']
+
+
+def test_create():
+    async def scenario():
+        server = GameServer()
+        response = await server.handle({'id': 1, 'op': 'create', 'width': 30, 'height': 16, 'mines': 99, 'seed': 7})
+        assert response == {'id': 1, 'session': 1, 'state': INIT, 'width': 30, 'height': 16, 'mines': 99}
+        response = await server.handle({'id': 2, 'op': 'create', 'width': 3, 'height': 3, 'mines': 50})
+        # Mines are capped so that the first square and its neighbours are free of them.
+        assert response['session'] == 2 and response['mines'] == 0
+        assert set(server.sessions) == {1, 2}
+    run(scenario())
+
+
+def test_uncover_and_close():
+    async def scenario():
+        server = GameServer()
+        session = await create(server)
+        response = await server.handle({'id': 1, 'op': 'uncover', 'session': session, 'x': 4, 'y': 4})
+        assert response['state'] == PROGRESS
+        assert [4, 4, 0] in response['changed']
+        response = await server.handle({'id': 2, 'op': 'toggle', 'session': session, 'x': 0, 'y': 0})
+        assert response['changed'] in ([], [[0, 0, MARKED_CELL]])
+        response = await server.handle({'id': 3, 'op': 'close', 'session': session})
+        assert response == {'id': 3}
+        response = await server.handle({'id': 4, 'op': 'uncover', 'session': session, 'x': 4, 'y': 4})
+        assert response == {'id': 4, 'error': 'no such session'}
+    run(scenario())
+
+
+def test_hints_played_as_moves():
+    async def scenario():
+        server = GameServer()
+        session = await create(server, width=16, height=16, mines=40, seed=3)
+        response = {'state': INIT}
+        for _ in range(1000):
+            if response['state'] not in (INIT, PROGRESS):
+                break
+            hint = await server.handle({'id': 1, 'op': 'hint', 'session': session})
+            assert hint['move'] == hint['moves'][0]
+            response = await server.handle({'id': 2, 'op': 'moves', 'session': session, 'moves': hint['moves']})
+            assert 'error' not in response, response
+        # The seed decides whether the solver has to guess and may lose, the game is over either way.
+        assert response['state'] in (WINNER, GAME_OVER)
+        assert len(response['mines']) == 40
+    run(scenario())
+
+
+def test_moves_rejected_as_a_whole():
+    async def scenario():
+        server = GameServer()
+        session = await create(server)
+        for moves in [[[4, 4, 'UNCOVER'], [9, 0, 'MARK']], [[4, 4, 'UNCOVER'], [1.5, 0, 'MARK']],
+                      [[4, 4, 'UNCOVER'], [0, 0]], [[4, 4, 'UNCOVER'], [0, 0, 'TOGGLE']], {'x': 4}, 'moves']:
+            response = await server.handle({'id': 1, 'op': 'moves', 'session': session, 'moves': moves})
+            assert 'error' in response, moves
+        # None of the moves was played.
+        minesweeper = server.sessions[session].minesweeper
+        assert minesweeper.game_state == INIT and not minesweeper.uncovered
+    run(scenario())
+
+
+@pytest.mark.parametrize('request_fields', [
+    {'op': 'create', 'width': 9.5, 'height': 9, 'mines': 10},
+    {'op': 'create', 'width': float('inf'), 'height': 9, 'mines': 10},
+    {'op': 'create', 'width': 9, 'height': 9, 'mines': '10'},
+    {'op': 'create', 'width': True, 'height': 9, 'mines': 10},
+    {'op': 'create', 'width': 9, 'height': 9, 'mines': 10, 'seed': 1.5},
+    {'op': 'create', 'width': 1000, 'height': 1000, 'mines': 10},
+    {'op': 'create', 'width': 9, 'height': 9},
+    {'op': 'uncover', 'x': 4.0, 'y': 4},
+    {'op': 'uncover', 'x': float('inf'), 'y': 4},
+    {'op': 'toggle', 'x': 4, 'y': 10 ** 30},
+    {'op': 'uncover_neighbours', 'x': None, 'y': 4},
+    {'op': 'uncover', 'x': 4},
+    {'op': 'moves', 'moves': [[float('inf'), 4, 'UNCOVER']]},
+    {'op': 'moves', 'moves': [[4, 4, 'UNCOVER']] * 10001},
+    {'op': 'uncover', 'session': [1], 'x': 4, 'y': 4},
+    {'op': 'explode'},
+])
+def test_malformed_requests_answered_with_an_error(request_fields):
+    async def scenario():
+        server = GameServer()
+        session = await create(server)
+        response = await server.handle({'id': 7, 'session': session, **request_fields})
+        assert set(response) == {'id', 'error'} and response['id'] == 7
+        # The session is left as it was.
+        assert server.sessions[session].minesweeper.game_state == INIT
+    run(scenario())
+
+
+def test_eviction():
+    async def scenario():
+        server = GameServer(idle_timeout=60.0, max_sessions=2)
+        first = await create(server)
+        second = await create(server)
+        response = await server.handle({'id': 1, 'op': 'create', 'width': 9, 'height': 9, 'mines': 10})
+        assert response['error'] == 'too many sessions'
+        # Sessions in use are never evicted, idle ones are.
+        server.sessions[first].last_used -= 120
+        await server.handle({'id': 2, 'op': 'uncover', 'session': second, 'x': 0, 'y': 0})
+        third = await create(server)
+        assert set(server.sessions) == {second, third}
+        assert server.evict(monotonic() + 30) == 0
+        assert server.evict(monotonic() + 120) == 2
+        assert not server.sessions
+    run(scenario())
+
+
+def test_connection():
+    # Requests over TCP, malformed lines included, each answered by a line in order.
+    async def scenario():
+        server = GameServer()
+        tcp_server = await asyncio.start_server(server.connection, '127.0.0.1', 0)
+        port = tcp_server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        lines = [b'{"id": 1, "op": "create", "width": 9, "height": 9, "mines": 10, "seed": 2}',
+                 b'not json', b'[1, 2]',
+                 b'{"id": 2, "op": "uncover", "session": 1, "x": 1e999, "y": 0}',
+                 b'{"id": 3, "op": "uncover", "session": 1, "x": 4, "y": 4}']
+        writer.write(b'\n'.join(lines) + b'\n')
+        await writer.drain()
+        responses = [json.loads(await reader.readline()) for _ in lines]
+        writer.close()
+        tcp_server.close()
+        await tcp_server.wait_closed()
+        return responses
+
+    created, not_json, not_object, overflow, uncovered = run(scenario())
+    assert created['session'] == 1
+    assert not_json == not_object == {'id': None, 'error': 'malformed request'}
+    assert overflow == {'id': 2, 'error': 'x must be an integer'}
+    assert uncovered['id'] == 3 and uncovered['state'] in (PROGRESS, WINNER)
+    assert all(code != COVERED_CELL for _, _, code in uncovered['changed'])
@@ -0,0 +1,106 @@
+from itertools import combinations
+
+import pytest
+
+from minesweeper import MineSweeper, MINE_FLAG, UNCOVERED_FLAG, MARKED_FLAG
+from utilities import solver, MARK
+
+
+def assert_sound(minesweeper, move):
+    # A move of the solver which is not a guess marks a mine or uncovers a square without one.
+    position, operation = move
+    mine = bool(minesweeper.field.flags[minesweeper.field.index(position)] & MINE_FLAG)
+    assert mine == (operation == MARK), move
+
+
+@pytest.mark.parametrize('advanced', [False, True])
+def test_queued_moves_dropped_when_a_mark_is_removed(advanced):
+    # Mark safe squares next to the uncovered region one at a time, let the solver deduce from the wrong mark,
+    # then remove it: the moves deduced from it must not be returned anymore.
+    checked = 0
+    for seed in range(60):
+        minesweeper = MineSweeper(9, 9, 10, seed=seed)
+        steps = solver(minesweeper, advanced=advanced)
+        minesweeper.uncover(next(steps)[0])
+        field = minesweeper.field
+        candidates = [index for index, flags in enumerate(field.flags)
+                      if not flags & (UNCOVERED_FLAG | MINE_FLAG)
+                      and any(field.flags[neighbour] & UNCOVERED_FLAG for neighbour in field.neighbours[index])]
+        for index in candidates[:3]:
+            position = field.position(index)
+            minesweeper.toggle(position, force_mark=True)
+            try:
+                next(steps)
+            except StopIteration:
+                pass
+            # Marked -> uncertain -> covered.
+            minesweeper.toggle(position)
+            minesweeper.toggle(position)
+            try:
+                move = next(steps)
+            except StopIteration:
+                continue
+            if getattr(steps, 'guessed', False):
+                continue
+            assert_sound(minesweeper, move)
+            checked += 1
+    assert checked
+
+
+def test_probabilities_between_moves():
+    # Asking for the probabilities brings the frontier up to date, which must not break the next move.
+    for seed in range(200):
+        size = 4 + seed % 5
+        minesweeper = MineSweeper(size, size, size, seed=seed)
+        steps = solver(minesweeper, advanced=True)
+        while not minesweeper.game_over():
+            if minesweeper.uncovered:
+                probabilities = steps.probabilities()
+                assert all(0.0 <= probability <= 1.0 for probability in probabilities.values())
+            try:
+                position, operation = next(steps)
+            except StopIteration:
+                break
+            if operation == MARK:
+                minesweeper.toggle(position, force_mark=True)
+            else:
+                minesweeper.uncover(position)
+
+
+def brute_force_probabilities(minesweeper):
+    # The probability of a mine on every covered unmarked square, counting all the placements of the mines left
+    # which agree with the numbers shown, marked squares taken as mines.
+    field = minesweeper.field
+    flags = field.flags
+    unknown = [index for index, square in enumerate(flags) if not square & (UNCOVERED_FLAG | MARKED_FLAG)]
+    constraints = [(set(field.neighbours[index]), field.counts[index]) for index, square in enumerate(flags)
+                   if square & UNCOVERED_FLAG]
+    remaining = minesweeper.field_mines - field.marked
+    mine_counts = dict.fromkeys(unknown, 0)
+    placements = 0
+    for mines in combinations(unknown, remaining):
+        placed = set(mines)
+        if all(sum(1 for neighbour in neighbours if neighbour in placed or flags[neighbour] & MARKED_FLAG) == count
+               for neighbours, count in constraints):
+            placements += 1
+            for index in mines:
+                mine_counts[index] += 1
+    return {field.position(index): count / placements for index, count in mine_counts.items()}
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_probabilities_match_brute_force(seed):
+    minesweeper = MineSweeper(5, 5, 5, seed=seed)
+    steps = solver(minesweeper, advanced=True)
+    while not minesweeper.game_over():
+        if minesweeper.uncovered:
+            expected = brute_force_probabilities(minesweeper)
+            probabilities = steps.probabilities()
+            assert probabilities.keys() == expected.keys()
+            for position, probability in expected.items():
+                assert probabilities[position] == pytest.approx(probability)
+        position, operation = next(steps)
+        if operation == MARK:
+            minesweeper.toggle(position, force_mark=True)
+        else:
+            minesweeper.uncover(position)
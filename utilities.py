@@ -1,53 +1,446 @@
-from minesweeper import INIT, PROGRESS, WINNER, GAME_OVER
+from collections import deque
+from math import exp, lgamma
+from sys import float_info
 
-MARK = 'MARK'
-UNCOVER = 'UNCOVER'
+from minesweeper import INIT, PROGRESS, WINNER, GAME_OVER, MARK, UNCOVER
+from minesweeper import UNCOVERED_FLAG, MARKED_FLAG, UNCERTAIN_FLAG
 
 
-def solver(minesweeper):
+class Solver:
     """ This is a basic solver, which uses mine neighbours to mark potential mines
         and uncover the field. However does not yield solutions in any of the indirect cases.
-        This solver returns a generator. Use the returned values to either uncover or mark a square.
-        First it returns squares it feels should be marked, then squares which it thinks should be uncovered.
-        Once generator stopped yielding, create a new generator and use it obtain solutions.
-        However if a generator never yielded a value, then the solver does not know how to proceed,
-        then there is no use using the solver again until the change in the field (new square uncovered or marked).
+        The solver is an iterator, use the returned values to either uncover or mark a square.
+        It follows the changes of the minesweeper, and keeps the frontier (uncovered mine neighbours
+        which still have covered neighbours) along with a worklist of the squares around the last changes,
+        so finding the next move only examines squares near what changed since the previous one.
+        When next raises StopIteration the solver does not know how to proceed,
+        then there is no use asking again until the change in the field (new square uncovered or marked),
+        after which the same solver continues yielding moves.
+        Call close once done with the solver, to stop following the minesweeper.
         """
-    if minesweeper.game_state == INIT:
-        # If game is just started uncover a square in the middle, it may most likely uncover more area.
-        init_position = minesweeper.field_width // 2, minesweeper.field_height // 2
-        yield init_position, UNCOVER
-
-    if minesweeper.game_state == PROGRESS:
-        for position, square in minesweeper.field.items():
-            if square.uncovered and square.neighbour_mines:
-                # Find number of uncovered squares surrounding the mine neighbour.
-                # if it matches the number of mines, mark the remaining unmarked squares as mines
-                covered = list(
-                    filter(lambda pos: not minesweeper.field[pos].uncovered, minesweeper.neighbours(position)))
-                if len(covered) == square.neighbouring_mines:
-                    for pos in covered:
-                        if not minesweeper.field[pos].marked:
-                            yield pos, MARK
-
-        for position, square in minesweeper.field.items():
-            if square.uncovered and square.neighbour_mines:
-                # Find the marked and unmarked covered squares surrounding the mine neighbour.
-                # If the number of marked matches the number of mines, uncover the covered squares surrounding it.
-                unmarked = list(
-                    filter(lambda pos: not (minesweeper.field[pos].uncovered or minesweeper.field[pos].marked),
-                           minesweeper.neighbours(position)))
-                marked = list(
-                    filter(lambda pos: minesweeper.field[pos].marked, minesweeper.neighbours(position)))
-                if len(marked) == square.neighbouring_mines:
-                    # Then all unmarked covered can be uncovered
-                    for pos in unmarked:
-                        if not minesweeper.field[pos].uncovered:
-                            # Any previous uncover operation may have potentially uncovered the square
-                            # thus to avoid redundant operation.
-                            yield pos, UNCOVER
-
-    if minesweeper.game_state == WINNER or minesweeper.game_state == GAME_OVER:
-        # Game is over! Nothing to do.
-        pass
 
+    def __init__(self, minesweeper):
+        self.minesweeper = minesweeper
+        # Indices of the uncovered mine neighbours which still have unmarked covered neighbours.
+        self.frontier = set()
+        # Indices of squares to examine, since something around them changed.
+        self.worklist = set()
+        # Moves found but not returned yet, as (index, operation).
+        self.moves = deque()
+        minesweeper.add_listener(self.on_change)
+        self.on_change(None)
+
+    def close(self):
+        self.minesweeper.remove_listener(self.on_change)
+
+    def on_change(self, positions):
+        field = self.minesweeper.field
+        if positions is None:
+            # Whole field changed, start over and examine all uncovered mine neighbours once.
+            self.moves.clear()
+            self.worklist.clear()
+            self.frontier.clear()
+            if self.minesweeper.game_state == PROGRESS:
+                flags, counts = field.flags, field.counts
+                self.worklist.update(index for index in field.played()
+                                     if flags[index] & UNCOVERED_FLAG and counts[index])
+            return
+
+        flags = field.flags
+        for position in positions:
+            # Both the changed square and its neighbours may now lead to a move.
+            index = field.index(position)
+            self.worklist.add(index)
+            self.worklist.update(field.neighbours[index])
+            if self.moves and not flags[index] & (UNCOVERED_FLAG | MARKED_FLAG):
+                # A mark was removed, the moves queued may follow from it. Drop them and examine the frontier again,
+                # every queued move came from one of its squares.
+                self.moves.clear()
+                self.worklist.update(self.frontier)
+
+    def examine(self, index):
+        # Queues the moves that follow from the square at the given index and updates the frontier.
+        field = self.minesweeper.field
+        flags, counts = field.flags, field.counts
+        if not flags[index] & UNCOVERED_FLAG or not counts[index]:
+            return
+        unmarked = [neighbour for neighbour in field.neighbours[index] if not flags[neighbour] & UNCOVERED_FLAG
+                    and not flags[neighbour] & MARKED_FLAG]
+        if not unmarked:
+            self.frontier.discard(index)
+            return
+        self.frontier.add(index)
+        marked = sum(1 for neighbour in field.neighbours[index] if flags[neighbour] & MARKED_FLAG)
+        if marked + len(unmarked) == counts[index]:
+            # If the number of covered squares surrounding the mine neighbour matches the number of mines,
+            # mark the remaining unmarked squares as mines
+            self.moves.extend((neighbour, MARK) for neighbour in unmarked)
+        elif marked == counts[index]:
+            # If the number of marked matches the number of mines, uncover the covered squares surrounding it.
+            self.moves.extend((neighbour, UNCOVER) for neighbour in unmarked)
+
+    def deductions(self):
+        """ Returns the moves the solver already deduced but did not return yet, as a list of (position, MARK or
+        UNCOVER), so that they are played along with the last returned one in a single MineSweeper.apply_moves.
+        None of them is a guess, they follow from the field as it was when the last move was returned. """
+        if self.minesweeper.game_state != PROGRESS:
+            return []
+        flags = self.minesweeper.field.flags
+        position = self.minesweeper.field.position
+        moves, seen = [], set()
+        while self.moves:
+            index, operation = self.moves.popleft()
+            if not flags[index] & (UNCOVERED_FLAG | MARKED_FLAG) and index not in seen:
+                seen.add(index)
+                moves.append((position(index), operation))
+        return moves
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        minesweeper = self.minesweeper
+        if minesweeper.game_state == INIT:
+            # If game is just started uncover a square in the middle, it may most likely uncover more area.
+            init_position = minesweeper.field_width // 2, minesweeper.field_height // 2
+            return init_position, UNCOVER
+
+        if minesweeper.game_state == PROGRESS:
+            field = minesweeper.field
+            while self.moves or self.worklist:
+                while self.moves:
+                    index, operation = self.moves.popleft()
+                    # Any previous operation may have potentially uncovered or marked the square
+                    # thus to avoid redundant operation.
+                    if not field.flags[index] & (UNCOVERED_FLAG | MARKED_FLAG):
+                        return field.position(index), operation
+                # The worklist may have been emptied along with stale moves left, by constraints.
+                if self.worklist:
+                    self.examine(self.worklist.pop())
+
+        if minesweeper.game_state == WINNER or minesweeper.game_state == GAME_OVER:
+            # Game is over! Nothing to do.
+            pass
+        raise StopIteration
+
+
+def _enumerate_component(size, constraints):
+    # Counts the mine configurations of a component of `size` unknown squares satisfying all the constraints,
+    # given as (local indices of the squares, number of mines among them).
+    # Squares are assigned one after the other, pruning as soon as a constraint can't be satisfied, and the
+    # configurations of the remaining squares are memoized on the mines placed so far in the constraints which
+    # are still open, so that long chains of constraints don't blow up exponentially.
+    # Returns a dict from number of mines to [number of configurations, configurations with a mine per square].
+    members = [[] for _ in range(size)]
+    first, last = [], []
+    for constraint, (squares, _) in enumerate(constraints):
+        squares = sorted(squares)
+        for rank, square in enumerate(squares):
+            members[square].append((constraint, len(squares) - rank - 1))
+        first.append(squares[0])
+        last.append(squares[-1])
+    active = [tuple(constraint for constraint in range(len(constraints)) if first[constraint] < i <= last[constraint])
+              for i in range(size)]
+    required = [mines for _, mines in constraints]
+    placed = [0] * len(constraints)
+    memo = {}
+
+    def solve(i):
+        if i == size:
+            return {0: [1, []]}
+        key = i, tuple(placed[constraint] for constraint in active[i])
+        if key in memo:
+            return memo[key]
+        result = {}
+        for value in (0, 1):
+            if any(placed[constraint] + value > required[constraint] or
+                   placed[constraint] + value + left < required[constraint] for constraint, left in members[i]):
+                continue
+            for constraint, _ in members[i]:
+                placed[constraint] += value
+            for mines, (count, square_counts) in solve(i + 1).items():
+                entry = result.get(mines + value)
+                if entry is None:
+                    result[mines + value] = [count, [count * value] + square_counts]
+                else:
+                    entry[0] += count
+                    entry[1] = [count * value + entry[1][0]] + [a + b for a, b in zip(entry[1][1:], square_counts)]
+            for constraint, _ in members[i]:
+                placed[constraint] -= value
+        memo[key] = result
+        return result
+
+    return solve(0)
+
+
+def _log_binomial(n, k):
+    # The natural logarithm of the number of ways to choose k among n.
+    return lgamma(n + 1) - lgamma(k + 1) - lgamma(n - k + 1)
+
+
+def _convolve(first, second):
+    # Combines two distributions of number of mines to number of configurations.
+    result = {}
+    for a, count_a in first.items():
+        for b, count_b in second.items():
+            result[a + b] = result.get(a + b, 0) + count_a * count_b
+    return result
+
+
+class AdvancedSolver(Solver):
+    """ A solver which continues where the basic one gives up.
+        First it compares overlapping constraints of the frontier (a square with neighbouring mines and its unmarked
+        covered neighbours), where the difference in mines between two of them may tell that the squares only one
+        of them sees are all mines or all free, which solves patterns like 1-2-1.
+        Then it splits the frontier into independent components and enumerates the mine configurations of each one,
+        weighting them by the ways to place the remaining mines on the squares away from the frontier,
+        which gives the probability of a mine on each square. Squares that are certainly free or mines are played,
+        otherwise it guesses the square least likely to be a mine.
+        guessed tells whether the last returned move was a guess, and guesses counts them.
+        """
+
+    # Components with more unknown squares than this are not enumerated, their squares are estimated
+    # from their constraints instead.
+    component_limit = 64
+
+    def __init__(self, minesweeper):
+        self.guesses = 0
+        self.guessed = False
+        self.components = {}
+        self.analysis = None
+        super().__init__(minesweeper)
+
+    def on_change(self, positions):
+        self.analysis = None
+        super().on_change(positions)
+
+    def constraints(self):
+        # Returns the constraints of the frontier, as a dict from the index of the square with neighbouring mines
+        # to (the tuple of indices of its unmarked covered neighbours, number of mines among them).
+        while self.worklist:
+            # Bring the frontier up to date.
+            self.examine(self.worklist.pop())
+        field = self.minesweeper.field
+        flags, counts = field.flags, field.counts
+        constraints = {}
+        for index in self.frontier:
+            unknown = tuple(neighbour for neighbour in field.neighbours[index]
+                            if not flags[neighbour] & (UNCOVERED_FLAG | MARKED_FLAG))
+            marked = sum(1 for neighbour in field.neighbours[index] if flags[neighbour] & MARKED_FLAG)
+            if unknown:
+                constraints[index] = unknown, counts[index] - marked
+        return constraints
+
+    def deduce(self, constraints):
+        # Queues the moves following from pairs of overlapping constraints.
+        # If b has as many more mines than a as it has squares a doesn't see, those squares are all mines
+        # and the squares only a sees are all free. Returns whether any move was found.
+        watchers = {}
+        for index, (unknown, _) in constraints.items():
+            for square in unknown:
+                watchers.setdefault(square, []).append(index)
+        found = False
+        for a, (unknown_a, mines_a) in constraints.items():
+            overlapping = {b for square in unknown_a for b in watchers[square] if b != a}
+            for b in overlapping:
+                unknown_b, mines_b = constraints[b]
+                only_b = [square for square in unknown_b if square not in unknown_a]
+                if mines_b - mines_a == len(only_b):
+                    only_a = [square for square in unknown_a if square not in unknown_b]
+                    if only_a or only_b:
+                        self.moves.extend((square, MARK) for square in only_b)
+                        self.moves.extend((square, UNCOVER) for square in only_a)
+                        found = True
+        return found
+
+    def component(self, squares, constraints):
+        # Enumerates the component of the given squares, with constraints on their local indices.
+        # Components unchanged since a previous move are not enumerated again.
+        key = tuple(sorted((tuple(sorted(squares[square] for square in local)), mines)
+                           for local, mines in constraints))
+        result = self.components.get(key)
+        if result is None:
+            if len(self.components) > 4096:
+                self.components.clear()
+            result = self.components[key] = squares, _enumerate_component(len(squares), constraints)
+        return result
+
+    def analyse(self):
+        # Returns (dict from frontier square index to (mine configurations, all configurations),
+        # the probability of a mine on a square away from the frontier, number of such squares).
+        if self.analysis is not None:
+            return self.analysis
+        minesweeper = self.minesweeper
+        field = minesweeper.field
+        constraints = self.constraints()
+
+        # Split the frontier into independent components, in the order the constraints reach the squares.
+        watchers = {}
+        for index, (unknown, _) in constraints.items():
+            for square in unknown:
+                watchers.setdefault(square, []).append(index)
+        components, assigned = [], set()
+        for start in constraints:
+            if start in assigned:
+                continue
+            assigned.add(start)
+            queue, squares, local, component_constraints = deque([start]), [], {}, []
+            while queue:
+                index = queue.popleft()
+                unknown, mines = constraints[index]
+                for square in unknown:
+                    if square not in local:
+                        local[square] = len(squares)
+                        squares.append(square)
+                        for other in watchers[square]:
+                            if other not in assigned:
+                                assigned.add(other)
+                                queue.append(other)
+                component_constraints.append((tuple(local[square] for square in unknown), mines))
+            components.append((squares, component_constraints))
+
+        # Squares covered and not marked, and the mines which are not marked yet.
+        unknown_squares = len(field) - minesweeper.uncovered - field.marked
+        interior = unknown_squares - len(watchers)
+        remaining_mines = minesweeper.field_mines - field.marked
+
+        exact, estimated = [], {}
+        for squares, component_constraints in components:
+            if len(squares) > self.component_limit:
+                # Too large to enumerate, estimate each square from the most dangerous constraint on it.
+                for local, mines in component_constraints:
+                    for square in local:
+                        estimated[squares[square]] = max(estimated.get(squares[square], 0), mines / len(local))
+                continue
+            exact.append(self.component(squares, component_constraints))
+
+        distributions = [{mines: entry[0] for mines, entry in result.items()} for _, result in exact]
+        total = {0: 1}
+        for distribution in distributions:
+            total = _convolve(total, distribution)
+
+        # Ways to place the remaining mines on the squares away from the frontier, for each number of mines on the
+        # frontier, relative to the largest: the binomials themselves grow far too large on large boards.
+        # Taken in log space, and never below the smallest float, so that no possible placement counts for nothing.
+        log_weights = {mines: _log_binomial(interior, remaining_mines - mines) for mines in total
+                       if 0 <= remaining_mines - mines <= interior}
+        largest = max(log_weights.values(), default=0.0)
+        weights_by_mines = {mines: max(exp(log_weight - largest), float_info.min)
+                            for mines, log_weight in log_weights.items()}
+
+        def weight(mines):
+            return weights_by_mines.get(mines, 0)
+
+        use_global = True
+        if not sum(count * weight(mines) for mines, count in total.items()):
+            # The marks on the field contradict the number of mines, ignore the number of mines then.
+            use_global = False
+
+        probabilities = {}
+        for j, (ordered, result) in enumerate(exact):
+            others = {0: 1}
+            for i, distribution in enumerate(distributions):
+                if i != j:
+                    others = _convolve(others, distribution)
+            weights = {mines: sum(count * weight(mines + other) for other, count in others.items())
+                       if use_global else 1 for mines in result}
+            all_configurations = sum(entry[0] * weights[mines] for mines, entry in result.items())
+            if not all_configurations:
+                # Wrongly marked squares make the component impossible, nothing is known about its squares then.
+                probabilities.update((square, (0.5, 1)) for square in ordered)
+                continue
+            for i, square in enumerate(ordered):
+                mine_configurations = sum(entry[1][i] * weights[mines] for mines, entry in result.items())
+                probabilities[square] = mine_configurations, all_configurations
+        for square, probability in estimated.items():
+            # Estimated squares are never certain.
+            probabilities[square] = min(max(probability, 0.01), 0.99), 1
+
+        interior_probability = None
+        if interior > 0:
+            if use_global:
+                configurations = sum(count * weight(mines) for mines, count in total.items())
+                expected_mines = sum(count * weight(mines) * (remaining_mines - mines) for mines, count in total.items())
+                interior_probability = expected_mines / (configurations * interior)
+            else:
+                interior_probability = min(max(remaining_mines / unknown_squares, 0.0), 1.0)
+        self.analysis = probabilities, interior_probability, interior
+        return self.analysis
+
+    def probabilities(self):
+        """ Returns a dict from the position of each covered unmarked square to the probability of a mine on it. """
+        probabilities, interior_probability, _ = self.analyse()
+        field = self.minesweeper.field
+        result = {field.position(square): mine_configurations / all_configurations
+                  for square, (mine_configurations, all_configurations) in probabilities.items()}
+        if interior_probability is not None:
+            for index in field.covered():
+                if index not in probabilities:
+                    result[field.position(index)] = interior_probability
+        return result
+
+    def probability(self, position):
+        """ Returns the probability of a mine on the square at the given position. """
+        field = self.minesweeper.field
+        index = field.index(position)
+        if field.flags[index] & UNCOVERED_FLAG:
+            return 0.0
+        if field.flags[index] & MARKED_FLAG:
+            return 1.0
+        probabilities, interior_probability, _ = self.analyse()
+        if index in probabilities:
+            mine_configurations, all_configurations = probabilities[index]
+            return mine_configurations / all_configurations
+        return interior_probability
+
+    def __next__(self):
+        self.guessed = False
+        minesweeper = self.minesweeper
+        while True:
+            try:
+                return super().__next__()
+            except StopIteration:
+                if minesweeper.game_state != PROGRESS:
+                    raise
+            # The basic solver is stuck, try the overlapping constraints.
+            if self.deduce(self.constraints()):
+                continue
+            probabilities, interior_probability, interior = self.analyse()
+            certain = False
+            for square, (mine_configurations, all_configurations) in probabilities.items():
+                if mine_configurations == 0:
+                    self.moves.append((square, UNCOVER))
+                    certain = True
+                elif mine_configurations == all_configurations:
+                    self.moves.append((square, MARK))
+                    certain = True
+            if certain:
+                continue
+            return self.guess(probabilities, interior_probability, interior)
+
+    def guess(self, probabilities, interior_probability, interior):
+        # Uncovers the square least likely to be a mine.
+        field = self.minesweeper.field
+        flags = field.flags
+        best, best_probability = None, None
+        for square, (mine_configurations, all_configurations) in probabilities.items():
+            probability = mine_configurations / all_configurations
+            if not flags[square] & UNCERTAIN_FLAG and (best is None or probability < best_probability):
+                best, best_probability = square, probability
+        if interior and (best is None or interior_probability < best_probability):
+            for index in field.covered():
+                if not flags[index] & UNCERTAIN_FLAG and index not in probabilities:
+                    best, best_probability = index, interior_probability
+                    break
+        if best is None:
+            raise StopIteration
+        # When all the remaining mines are on the frontier, squares away from it are certain and not a guess.
+        if best_probability > 0:
+            self.guesses += 1
+            self.guessed = True
+        return field.position(best), UNCOVER
+
+
+def solver(minesweeper, advanced=False):
+    """ Returns a Solver following the given minesweeper, an AdvancedSolver if advanced. """
+    return AdvancedSolver(minesweeper) if advanced else Solver(minesweeper)
@@ -0,0 +1,74 @@
+def local_position(pixel, offset, size):
+    # Returns the given window pixel relative to the rectangle at offset with the given size,
+    # or None if the pixel lies outside of the rectangle.
+    x, y = pixel[0] - offset[0], pixel[1] - offset[1]
+    if 0 <= x < size[0] and 0 <= y < size[1]:
+        return x, y
+    return None
+
+
+class Viewport:
+    """ The part of the field shown on the window.
+    The viewport occupies a rectangle of the window at offset with the given size, and shows the field
+    with tiles of tile_size pixels scrolled by scroll pixels, so converting between window pixels
+    and field positions is a constant time computation irrespective of the size of the field. """
+
+    def __init__(self, offset, size, tile_size, field_size):
+        self.offset = offset
+        self.size = size
+        self.tile_size = tile_size
+        self.field_size = field_size
+        self.scroll = (0, 0)
+
+    def field_position(self, pixel):
+        # Returns the position on the field shown at the given window pixel, or None if no square is shown there.
+        local = local_position(pixel, self.offset, self.size)
+        if local is None:
+            return None
+        x = (local[0] + self.scroll[0]) // self.tile_size[0]
+        y = (local[1] + self.scroll[1]) // self.tile_size[1]
+        if 0 <= x < self.field_size[0] and 0 <= y < self.field_size[1]:
+            return x, y
+        return None
+
+    def window_position(self, position):
+        # Returns the window pixel at which the top left corner of the square at the given position is drawn.
+        return (self.offset[0] + position[0] * self.tile_size[0] - self.scroll[0],
+                self.offset[1] + position[1] * self.tile_size[1] - self.scroll[1])
+
+    @property
+    def field_pixels(self):
+        # The size in pixels of the whole field at the current tile size.
+        return self.field_size[0] * self.tile_size[0], self.field_size[1] * self.tile_size[1]
+
+    def scroll_to(self, scroll):
+        # Scrolls to the given pixel of the field, kept within the field.
+        field_pixels = self.field_pixels
+        self.scroll = (max(0, min(scroll[0], field_pixels[0] - self.size[0])),
+                       max(0, min(scroll[1], field_pixels[1] - self.size[1])))
+
+    def scroll_by(self, dx, dy):
+        self.scroll_to((self.scroll[0] + dx, self.scroll[1] + dy))
+
+    def zoom_to(self, tile_size, pixel=None):
+        # Changes the tile size, keeping the point of the field under the given window pixel
+        # (the center of the viewport by default) in place.
+        if pixel is None:
+            pixel = self.offset[0] + self.size[0] // 2, self.offset[1] + self.size[1] // 2
+        local_x, local_y = pixel[0] - self.offset[0], pixel[1] - self.offset[1]
+        field_x = (local_x + self.scroll[0]) / self.tile_size[0]
+        field_y = (local_y + self.scroll[1]) / self.tile_size[1]
+        self.tile_size = tile_size
+        self.scroll_to((round(field_x * tile_size[0] - local_x), round(field_y * tile_size[1] - local_y)))
+
+    def visible_squares(self, area=None):
+        # Returns the ranges of x and y of the squares shown, entirely or partly, in the given area of the viewport
+        # (a rectangle relative to the viewport as (x, y, width, height), the whole viewport by default).
+        x, y, width, height = area if area is not None else (0, 0, self.size[0], self.size[1])
+        if width <= 0 or height <= 0:
+            return range(0), range(0)
+        first_x = max(0, (x + self.scroll[0]) // self.tile_size[0])
+        first_y = max(0, (y + self.scroll[1]) // self.tile_size[1])
+        last_x = min(self.field_size[0] - 1, (x + width - 1 + self.scroll[0]) // self.tile_size[0])
+        last_y = min(self.field_size[1] - 1, (y + height - 1 + self.scroll[1]) // self.tile_size[1])
+        return range(first_x, last_x + 1), range(first_y, last_y + 1)